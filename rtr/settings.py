@@ -58,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'tracker.viewstats.ViewStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -100,6 +101,29 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+# Rendered thread bodies are cached under versioned keys, so a per-process cache is safe;
+# a shared backend (e.g. memcached) would let all mod_wsgi processes reuse them.
+# The home page parts are invalidated by signals, so they need a cache every process shares.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/var/tmp/weathredds-dashboard',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -139,5 +163,13 @@ USE_TZ = True
 STATIC_URL = '/jcw/wt-static/'
 STATIC_ROOT = '/www/jcw/wt-static/'
 
+# Uploaded chart images, and the thumbnails generated from them (see tracker/charts.py)
+MEDIA_URL = '/jcw/wt-media/'
+MEDIA_ROOT = '/www/jcw/wt-media/'
+CHART_DERIVATIVE_WORKERS = 2 # processes used by 'manage.py buildchartderivatives'
+
+# Queries slower than this (ms) get an EXPLAIN in the per-view statistics (see tracker/viewstats.py)
+VIEW_STATS_EXPLAIN_MS = 100
+
 LOGIN_URL = '/weathredds/login/'
 LOGIN_REDIRECT_URL = '/weathredds/home'
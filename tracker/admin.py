@@ -28,3 +28,4 @@ admin.site.register(Discussion)
 admin.site.register(Chart)
 admin.site.register(Pin)
 admin.site.register(Tag)
+admin.site.register(ImportProgress)
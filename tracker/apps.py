@@ -19,7 +19,14 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+from .search import installTriggers
 
 
 class TrackerConfig(AppConfig):
     name = 'tracker'
+
+    def ready(self):
+        # connect signal receivers that keep denormalized fields up to date
+        from . import signals
+        post_migrate.connect(installTriggers, sender=self)
@@ -0,0 +1,142 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from tracker.models import Discussion, Thread, Event, Tag, Pin, ThreadActivity, bumpDataVersion
+import datetime
+import pytz
+import random
+
+# Seeded generator of synthetic data for the benchmarks. The same seed and volumes always give the same rows.
+
+benchmarkPassword = 'benchmark'
+words = ('trough', 'ridge', 'shortwave', 'jet', 'cold', 'front', 'warm', 'advection', 'snow', 'rain', 'sleet',
+    'freezing', 'convection', 'shear', 'instability', 'moisture', 'dewpoint', 'low', 'high', 'pressure',
+    'gfs', 'nam', 'ecmwf', 'ensemble', 'spread', 'qpf', 'timing', 'track', 'inversion', 'wind', 'gust', 'squall')
+
+class Volumes(object):
+    "How much data generate() makes."
+    def __init__(self, users=20, events=200, threadsPerEvent=5, looseThreads=100, discussionsPerThread=3,
+            tags=30, tagsPerEvent=2, pinsPerUser=3, years=2, fixedFraction=0.4, publicFraction=0.7):
+        self.users = users
+        self.events = events
+        self.threadsPerEvent = threadsPerEvent
+        self.looseThreads = looseThreads # threads in no event
+        self.discussionsPerThread = discussionsPerThread
+        self.tags = tags
+        self.tagsPerEvent = tagsPerEvent
+        self.pinsPerUser = pinsPerUser
+        self.years = years # events are spread over this many years before 'now'
+        self.fixedFraction = fixedFraction # share of events with owner-given dates (the rest float)
+        self.publicFraction = publicFraction
+
+class Dataset(object):
+    "What generate() made, for picking request parameters."
+    def __init__(self, users, events, threads, tags, start, end):
+        self.users = users # list of User
+        self.events = events # list of (pk, owner pk, effective start, effective end)
+        self.threads = threads # list of (pk, steward pk, validDate)
+        self.tags = tags # list of tag names
+        self.start = start
+        self.end = end
+
+def sentence(rng, n):
+    return ' '.join(rng.choice(words) for _ in range(n))
+
+def generate(seed=0, volumes=None, now=None):
+    '''
+    Fill the (empty) database with synthetic users, events, threads, discussions, tags and pins,
+    using bulk inserts and then the same stats refreshes the signal receivers would do.
+    '''
+    volumes = volumes or Volumes()
+    rng = random.Random(seed)
+    end = now or datetime.datetime(2017, 1, 1, tzinfo=pytz.UTC)
+    start = end - datetime.timedelta(days=365 * volumes.years)
+    span = (end - start).total_seconds()
+    password = make_password(benchmarkPassword)
+    with transaction.atomic():
+        User.objects.bulk_create([User(username='user{0:d}'.format(i), password=password, is_staff=(i == 0))
+            for i in range(volumes.users)])
+        users = list(User.objects.filter(username__startswith='user').order_by('pk'))
+        userPks = [u.pk for u in users]
+        events, threads, discussions = [], [], []
+        eventThreads, threadDiscussions = [], []
+        activity = {}
+        threadPk = discussionPk = 1
+        # floating events take their range from their threads, which are placed around a center time
+        eventSpecs = []
+        for eventPk in range(1, volumes.events + 1):
+            center = start + datetime.timedelta(seconds=rng.uniform(0, span))
+            length = datetime.timedelta(hours=rng.randint(6, 96))
+            fixed = rng.random() < volumes.fixedFraction
+            events.append(Event(pk=eventPk, title=sentence(rng, 3), owner_id=rng.choice(userPks), createdDate=center - length,
+                startDate=center - length / 2 if fixed else None, endDate=center + length / 2 if fixed else None,
+                isPublic=rng.random() < volumes.publicFraction, isPermanent=rng.random() < 0.2))
+            eventSpecs.append((eventPk, center, length))
+        threadEvents = [(eventPk, center, length) for (eventPk, center, length) in eventSpecs for _ in range(volumes.threadsPerEvent)]
+        threadEvents += [(None, start + datetime.timedelta(seconds=rng.uniform(0, span)), datetime.timedelta(hours=12))
+            for _ in range(volumes.looseThreads)]
+        for eventPk, center, length in threadEvents:
+            validDate = center + datetime.timedelta(seconds=rng.uniform(-0.5, 0.5) * length.total_seconds())
+            steward = rng.choice(userPks)
+            thread = Thread(pk=threadPk, title=sentence(rng, 4), validDate=validDate, steward_id=steward, isExtensible=rng.random() < 0.8,
+                discussionCount=volumes.discussionsPerThread)
+            thread.setCalendar()
+            threads.append(thread)
+            if eventPk is not None:
+                eventThreads.append(Event.threads.through(event_id=eventPk, thread_id=threadPk))
+            for i in range(volumes.discussionsPerThread):
+                author = steward if i == 0 else rng.choice(userPks)
+                createdDate = validDate - datetime.timedelta(hours=rng.randint(1, 72))
+                discussions.append(Discussion(pk=discussionPk, author_id=author, text=sentence(rng, rng.randint(20, 120)),
+                    createdDate=createdDate))
+                thread.lastActivity = max(thread.lastActivity or createdDate, createdDate)
+                activity[(author, threadPk)] = max(activity.get((author, threadPk), createdDate), createdDate)
+                threadDiscussions.append(Thread.discussions.through(thread_id=threadPk, discussion_id=discussionPk))
+                discussionPk += 1
+            threadPk += 1
+        tagNames = ['tag{0:d}-{1:s}'.format(i, rng.choice(words)) for i in range(volumes.tags)]
+        tagEvents = set()
+        for eventPk in range(1, volumes.events + 1):
+            for tagName in rng.sample(tagNames, min(volumes.tagsPerEvent, len(tagNames))):
+                tagEvents.add((tagName, eventPk))
+        pins = set()
+        for userPk in userPks:
+            for _ in range(volumes.pinsPerUser):
+                pins.add((userPk, rng.randint(1, volumes.events)))
+        Discussion.objects.bulk_create(discussions, batch_size=500)
+        Thread.objects.bulk_create(threads, batch_size=500)
+        Event.objects.bulk_create(events, batch_size=500)
+        Thread.discussions.through.objects.bulk_create(threadDiscussions, batch_size=500)
+        Event.threads.through.objects.bulk_create(eventThreads, batch_size=500)
+        ThreadActivity.objects.bulk_create([ThreadActivity(author_id=a, thread_id=t, lastActivity=d)
+            for ((a, t), d) in sorted(activity.items())], batch_size=500)
+        Tag.objects.bulk_create([Tag(name=name) for name in tagNames])
+        Tag.events.through.objects.bulk_create([Tag.events.through(tag_id=t, event_id=e) for (t, e) in sorted(tagEvents)], batch_size=500)
+        Pin.objects.bulk_create([Pin(owner_id=u, event_id=e) for (u, e) in sorted(pins)], batch_size=500)
+        # bulk_create skips the receivers in signals.py
+        Event.objects.all().refreshThreadStats()
+        for tag in Tag.objects.all():
+            tag.refreshEventCount()
+        bumpDataVersion()
+    return Dataset(users,
+        list(Event.objects.order_by('pk').values_list('pk', 'owner', 'effectiveStart', 'effectiveEnd')),
+        list(Thread.objects.order_by('pk').values_list('pk', 'steward', 'validDate')),
+        tagNames, start, end)
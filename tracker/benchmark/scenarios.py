@@ -0,0 +1,208 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from tracker import live
+from .generate import words
+import datetime
+import json
+import math
+import time
+
+# Timed requests against the views, driven through the test client. Each scenario is a function
+# (rng, dataset, user) -> (method, url, data); it is called once per request so every repetition
+# hits a different event, thread, tag or period. A string for data is sent as a JSON body.
+
+timeFormat = '%Y-%m-%d_%H:%M'
+
+def ownEvent(rng, dataset, user):
+    return rng.choice([e for e in dataset.events if e[1] == user.pk] or dataset.events)
+
+def ownThread(rng, dataset, user):
+    return rng.choice([t for t in dataset.threads if t[1] == user.pk] or dataset.threads)
+
+def period(rng, dataset, days):
+    start = randomTime(rng, dataset.start, dataset.end - days)
+    return start.strftime(timeFormat), (start + days).strftime(timeFormat)
+
+def randomTime(rng, start, end):
+    return start + datetime.timedelta(seconds=rng.uniform(0, (end - start).total_seconds()))
+
+def home(rng, dataset, user):
+    return 'get', reverse('home'), {}
+
+def singleEvent(rng, dataset, user):
+    return 'get', reverse('singleEvent', args=[rng.choice(dataset.events)[0]]), {}
+
+def singleThread(rng, dataset, user):
+    return 'get', reverse('singleThread', args=[rng.choice(dataset.threads)[0]]), {}
+
+def find(rng, dataset, user):
+    return 'post', reverse('find'), {
+        'textSearch': rng.choice(words),
+        'months': [str(rng.randint(1, 12))],
+        'tags': [rng.choice(dataset.tags)],
+    }
+
+def singleTag(rng, dataset, user):
+    return 'get', reverse('singleTag', args=[rng.choice(dataset.tags)]), {}
+
+def togglePin(rng, dataset, user):
+    return 'get', reverse('togglePin'), {'event': rng.choice(dataset.events)[0]}
+
+def toggleTag(rng, dataset, user):
+    return 'get', reverse('toggleTag'), {'event': ownEvent(rng, dataset, user)[0], 'tagName': rng.choice(dataset.tags)}
+
+def toggleFrozen(rng, dataset, user):
+    return 'get', reverse('toggleFrozen'), {'thread': ownThread(rng, dataset, user)[0]}
+
+def threadsForPeriod(rng, dataset, user):
+    timeFrom, timeTo = period(rng, dataset, datetime.timedelta(days=3))
+    return 'get', reverse('threadsForPeriod'), {'from': timeFrom, 'to': timeTo}
+
+def eventsAtTime(rng, dataset, user):
+    pk, validDate = rng.choice([(t[0], t[2]) for t in dataset.threads])
+    return 'get', reverse('eventsAtTime'), {'when': validDate.strftime(timeFormat), 'threadId': pk}
+
+def timelineEvents(rng, dataset, user):
+    # an older page starting somewhere in the data
+    when = randomTime(rng, dataset.start, dataset.end)
+    return 'get', reverse('timelineEvents'), {'older': '{0:s}_{1:d}'.format(when.strftime('%Y%m%d%H%M%S%f'), 0)}
+
+def timeline(rng, dataset, user):
+    timeFrom, timeTo = period(rng, dataset, datetime.timedelta(days=30))
+    return 'get', reverse('timeline'), {'from': timeFrom, 'to': timeTo, 'bin': 'day'}
+
+def review(rng, dataset, user):
+    kind = rng.choice(['year', 'month', 'season'])
+    value = {
+        'year': rng.randint(dataset.start.year, dataset.end.year),
+        'month': rng.randint(1, 12),
+        'season': rng.choice(['winter', 'spring', 'summer', 'autumn']),
+    }[kind]
+    return 'get', reverse('reviewData'), {kind: value}
+
+def associateEventsWithThread(rng, dataset, user):
+    pk = ownThread(rng, dataset, user)[0]
+    candidates = [e[0] for e in dataset.events if e[1] == user.pk][:10]
+    chosen = rng.sample(candidates, min(2, len(candidates)))
+    return 'get', reverse('associateEventsWithThread'), {
+        'threadId': pk,
+        'newRelations': chosen,
+        'allMatchingEvents': ','.join(str(e) for e in candidates),
+    }
+
+def associate(rng, dataset, user):
+    pk = ownThread(rng, dataset, user)[0]
+    candidates = [e[0] for e in dataset.events if e[1] == user.pk][:10]
+    chosen = rng.sample(candidates, min(2, len(candidates)))
+    return 'post', reverse('associate'), json.dumps({
+        'add': [[pk, e] for e in chosen[:1]],
+        'remove': [[pk, e] for e in chosen[1:]],
+    })
+
+def eventUpdates(rng, dataset, user):
+    # an update is published first, so the long-poll answers at once instead of waiting for its timeout
+    pk = ownEvent(rng, dataset, user)[0]
+    after = live.latestUpdate()
+    live.publish([pk], 'association', live.threadAssociated(ownThread(rng, dataset, user)[0], True))
+    return 'get', reverse('eventUpdates'), {'event': pk, 'after': after}
+
+scenarios = [
+    ('home', home),
+    ('singleEvent', singleEvent),
+    ('singleThread', singleThread),
+    ('find', find),
+    ('singleTag', singleTag),
+    ('togglePin', togglePin),
+    ('toggleTag', toggleTag),
+    ('toggleFrozen', toggleFrozen),
+    ('threadsForPeriod', threadsForPeriod),
+    ('eventsAtTime', eventsAtTime),
+    ('timelineEvents', timelineEvents),
+    ('timeline', timeline),
+    ('review', review),
+    ('associateEventsWithThread', associateEventsWithThread),
+    ('associate', associate),
+    ('eventUpdates', eventUpdates),
+]
+
+def send(client, method, url, data):
+    "Make a scenario's request through the test client."
+    if isinstance(data, basestring):
+        return getattr(client, method)(url, data, content_type='application/json')
+    return getattr(client, method)(url, data)
+
+def percentile(values, fraction):
+    "Nearest-rank percentile of a sorted list."
+    return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+def runScenario(scenario, rng, dataset, client, user, repeat, warmup=1):
+    '''
+    Time repeat requests (after warmup untimed ones) and return a dict of latency percentiles
+    in milliseconds, SQL query counts and the response status codes seen.
+    '''
+    latencies, queryCounts, statuses = [], [], {}
+    for i in range(warmup + repeat):
+        method, url, data = scenario(rng, dataset, user)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.time()
+            response = send(client, method, url, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.time() - started
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000.0)
+        queryCounts.append(len(queries))
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    latencies.sort()
+    queryCounts.sort()
+    return {
+        'requests': repeat,
+        'latencyMs': {
+            'min': latencies[0],
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1],
+            'mean': sum(latencies) / len(latencies),
+        },
+        'queries': {
+            'min': queryCounts[0],
+            'p50': percentile(queryCounts, 0.5),
+            'max': queryCounts[-1],
+            'mean': float(sum(queryCounts)) / len(queryCounts),
+        },
+        'statuses': statuses,
+    }
+
+def runScenarios(dataset, rng, repeat=50, names=None, user=None):
+    "Run the named scenarios (default all) as user (default the first generated one); returns {name: results}."
+    user = user or dataset.users[0]
+    client = Client()
+    client.force_login(user)
+    results = {}
+    for name, scenario in scenarios:
+        if names and name not in names:
+            continue
+        results[name] = runScenario(scenario, rng, dataset, client, user, repeat)
+    return results
@@ -0,0 +1,73 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from PIL import Image
+import hashlib
+import os
+
+# Thumbnails and web-sized copies of Chart images. Files are named by the SHA-1 of the original,
+# so generating them is idempotent and identical uploads share derivatives. Saving a chart only
+# marks it pending; 'manage.py buildchartderivatives' (run from cron) hashes and resizes the pending
+# images in its own process pool, so the web server never forks or spends request time on them.
+
+derivativeSizes = {
+    'thumb': (200, 200),
+    'web': (1024, 1024),
+}
+derivativeDir = 'charts/derived'
+
+def hashFile(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def derivativeName(imageHash, size):
+    # storage name (relative to MEDIA_ROOT) of one derivative
+    return '{0:s}/{1:s}/{2:s}_{3:s}.jpg'.format(derivativeDir, imageHash[:2], imageHash, size)
+
+def makeDerivatives(sourcePath, imageHash, mediaRoot, force=False):
+    '''
+    Write every size in derivativeSizes for the image at sourcePath, skipping any that already exist
+    (unless force). Runs in a worker process, so it only touches the filesystem.
+    Returns the number of files written.
+    '''
+    written = 0
+    image = None
+    for size, box in sorted(derivativeSizes.items()):
+        target = os.path.join(mediaRoot, derivativeName(imageHash, size))
+        if os.path.exists(target) and not force:
+            continue
+        if image is None:
+            image = Image.open(sourcePath)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+        copy = image.copy()
+        copy.thumbnail(box, Image.ANTIALIAS)
+        if not os.path.isdir(os.path.dirname(target)):
+            try:
+                os.makedirs(os.path.dirname(target))
+            except OSError:
+                pass # made by another worker in the meantime
+        # write to a temporary name first so a half-written file is never served
+        partial = target + '.{0:d}.part'.format(os.getpid())
+        copy.save(partial, 'JPEG', quality=85, optimize=True)
+        os.rename(partial, target)
+        written += 1
+    return written
@@ -0,0 +1,94 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.core.cache import caches
+from django.db import transaction
+from .models import Pin, Thread
+from . import viewstats
+import uuid
+
+# Cached parts of the home page. Each part is stored under a key made from the generations of the
+# data it was computed from; the receivers in signals.py bump exactly the generations a change affects,
+# after the transaction commits, and the stale entries are simply never read again. A bump stores a new
+# random token rather than incrementing: the file cache has no atomic incr(), and two processes
+# incrementing at once could both write the same number, leaving the stale parts in place.
+#
+# generations:
+#   pins:<user pk>         the user's pins, and the events they point to
+#   discussions:<user pk>  threads the user has written in (recentThreads)
+#   events:<user pk>       the user's private events (timeline)
+#   events:public          public events (everyone's timeline)
+#   tags                   tags and their event counts (tag cloud)
+
+def dashboardCache():
+    # looked up on each use, so an override of CACHES (as in the tests) takes effect
+    return caches['dashboard']
+
+dashboardTimeout = 10 * 60 # seconds; also bounds how stale time-relative parts (e.g. 'recent' threads) get
+
+def generations(names):
+    values = dashboardCache().get_many(['gen:' + name for name in names])
+    result = []
+    for name in names:
+        key = 'gen:' + name
+        if key not in values:
+            # never bumped, or evicted: start a fresh generation, since parts stored under the evicted
+            # one may still be in the cache; add() keeps one another process has just started
+            token = uuid.uuid4().hex
+            dashboardCache().add(key, token, None)
+            values[key] = dashboardCache().get(key, token)
+        result.append(values[key])
+    return result
+
+def bump(*names):
+    "Invalidate everything computed from the named generations, once the current transaction commits."
+    transaction.on_commit(lambda: bumpNow(names))
+
+def bumpNow(names):
+    dashboardCache().set_many(dict(('gen:' + name, uuid.uuid4().hex) for name in set(names)), None)
+
+def cachedPart(part, generationNames, compute):
+    '''
+    Value of compute() for this dashboard part, from the cache if none of the named generations
+    has changed since it was stored. Hits and misses are counted in viewstats.
+    '''
+    key = 'home:{0:s}:{1:s}'.format(part, ':'.join('{0:s}={1:s}'.format(n, g) for (n, g) in zip(generationNames, generations(generationNames))))
+    value = dashboardCache().get(key)
+    if value is None:
+        viewstats.count('dashboard.{0:s}.miss'.format(part))
+        value = compute()
+        dashboardCache().set(key, value, dashboardTimeout)
+    else:
+        viewstats.count('dashboard.{0:s}.hit'.format(part))
+    return value
+
+def bumpForEvents(events):
+    "Invalidate the timelines and pins showing any of the events (an Event queryset)."
+    names = []
+    for owner, isPublic in events.values_list('owner', 'isPublic'):
+        names.append('events:public' if isPublic else 'events:{0:d}'.format(owner))
+    names += ['pins:{0:d}'.format(u) for u in Pin.objects.filter(event__in=events).values_list('owner', flat=True)]
+    if names:
+        bump(*names)
+
+def bumpForThreads(threadPks):
+    "Invalidate the recent thread lists of everyone who has written in the threads."
+    authors = Thread.discussions.through.objects.filter(thread__in=threadPks).values_list('discussion__author', flat=True).distinct()
+    names = ['discussions:{0:d}'.format(a) for a in authors]
+    if names:
+        bump(*names)
@@ -0,0 +1,98 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.db.models import Prefetch
+from .models import Discussion, Event, Thread
+from itertools import islice
+import json
+import zlib
+
+# NDJSON export of events with their threads, discussions, tags and authors: one JSON object per line, one line per event.
+# Events are read in chunks of exportChunkSize by primary key, each chunk with its own prefetches,
+# so memory use does not grow with the size of the archive.
+
+exportChunkSize = 200
+
+def exportEvents(timeFrom=None, timeTo=None, tags=()):
+    "Event queryset for an export: events overlapping [timeFrom, timeTo] (if given) carrying any of tags (if given), as in find()."
+    events = Event.objects.all()
+    if timeFrom and timeTo:
+        events = events.spanning(timeFrom, timeTo)
+    if tags:
+        events = events.filter(tag__name__in=tags)
+    return events.distinct()
+
+def exportRecords(events, chunkSize=exportChunkSize):
+    "Yield one dict per event in the queryset, in primary key order."
+    pks = events.order_by('pk').values_list('pk', flat=True).iterator()
+    while True:
+        chunk = list(islice(pks, chunkSize))
+        if not chunk:
+            return
+        # iterator() skips prefetch_related, so every chunk is fetched as a regular (prefetching) queryset
+        threads = Thread.objects.select_related('steward').prefetch_related(
+            Prefetch('discussions', queryset=Discussion.objects.select_related('author').order_by('createdDate')))
+        for event in Event.objects.filter(pk__in=chunk).order_by('pk').select_related('owner').prefetch_related(
+                Prefetch('threads', queryset=threads.order_by('validDate')), 'tag_set'):
+            yield eventRecord(event)
+
+def eventRecord(event):
+    return {
+        'id': event.pk,
+        'title': event.title,
+        'owner': event.owner.username,
+        'createdDate': event.createdDate.isoformat(),
+        'startDate': isoformatOrNone(event.startDate),
+        'endDate': isoformatOrNone(event.endDate),
+        'effectiveStart': isoformatOrNone(event.effectiveStart),
+        'effectiveEnd': isoformatOrNone(event.effectiveEnd),
+        'isPublic': event.isPublic,
+        'isPermanent': event.isPermanent,
+        'tags': sorted(tag.name for tag in event.tag_set.all()),
+        'threads': [{
+            'id': thread.pk,
+            'title': thread.title,
+            'validDate': thread.validDate.isoformat(),
+            'isExtensible': thread.isExtensible,
+            'steward': thread.steward.username if thread.steward else None,
+            'discussions': [{
+                'id': discussion.pk,
+                'author': discussion.author.username,
+                'createdDate': discussion.createdDate.isoformat(),
+                'text': discussion.text,
+            } for discussion in thread.discussions.all()],
+        } for thread in event.threads.all()],
+    }
+
+def isoformatOrNone(dt):
+    return dt.isoformat() if dt else None
+
+def ndjsonLines(records):
+    for record in records:
+        yield json.dumps(record, sort_keys=True) + '\n'
+
+def gzipChunks(chunks):
+    "Compress an iterable of strings into a gzip stream, without holding more than one chunk."
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
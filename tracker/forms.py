@@ -27,10 +27,16 @@ class DiscussionFormTextOnly(forms.Form):
     _text = forms.CharField(label='discussion',widget=forms.Textarea)
 
 class EventForm(forms.Form):
-    #def __init__(self,*args,**kwargs):
-    #  super(EventForm,self).__init__(*args,**kwargs)
-    #  self.fields['_threadChoices'] = forms.MultipleChoiceField(choices=[(x.id,str(x)) for x in Thread.objects.all()])
-    #  super(EventForm, self).full_clean()
+    def __init__(self,*args,**kwargs):
+      user = kwargs.pop('user', None)
+      super(EventForm,self).__init__(*args,**kwargs)
+      # the thread list is filled in by the browser from async/threadsForPeriod, so an unbound form
+      # has no choices; a bound one only needs to know about the threads that were actually submitted
+      if self.is_bound:
+        threads = Thread.objects.visible_to(user) if user is not None else Thread.objects.all()
+        submitted = self.data.getlist(self.add_prefix('_threadChoices')) if hasattr(self.data, 'getlist') else self.data.get(self.add_prefix('_threadChoices'), [])
+        submitted = [x for x in submitted if unicode(x).isdigit()]
+        self.fields['_threadChoices'].choices = [(x.id,str(x)) for x in threads.filter(pk__in=submitted)]
     _title = forms.CharField(label='name this event')
     _isPinned = forms.BooleanField(required=False,initial=True,label='pin this event to your Home view')
     _isPublic = forms.BooleanField(required=False,label='share this event with other users')
@@ -40,9 +46,7 @@ class EventForm(forms.Form):
     _endDate = forms.DateField(required=False,label='end date (UTC, optional unless start date defined)',widget=jqDateInput)
     _endTime = forms.TimeField(required=False,label='end time (UTC, optional)',widget=jqTimeInput,input_formats=['%H:%M','%H%M'])
     # thread choice field will be populated asynchronously based on time specs
-    # NOTE you will have to comment this out when starting a new database, then uncomment after migrate
-    _threadChoices = forms.MultipleChoiceField(label='associate with threads (optional)',required=False,choices=[(x.id,str(x)) for x in Thread.objects.all()])
-    #_threadChoices = forms.MultipleChoiceField(label='associate with threads (optional)',required=False)
+    _threadChoices = forms.MultipleChoiceField(label='associate with threads (optional)',required=False)
 
 class ChangeEventForm(forms.ModelForm):
     class Meta:
@@ -55,10 +59,15 @@ class ChangeThreadForm(forms.ModelForm):
         fields = ['title','validDate']
 
 class FindForm(forms.Form):
-    # NOTE you will have to comment this out when starting a new database, then uncomment after migrate
-    tags = forms.MultipleChoiceField(required=False,label='return events with tag(s)',widget=forms.CheckboxSelectMultiple(attrs={'id':'findTags'}),choices=[(x.name,x.name) for x in Tag.objects.all()])
-    #tags = forms.MultipleChoiceField(required=False,label='return events with tag(s)',widget=forms.CheckboxSelectMultiple(attrs={'id':'findTags'}))
-    textSearch = forms.CharField(required=False,label='return threads containing text')
-    months = forms.MultipleChoiceField(required=False,label='get results from only these months',widget=forms.CheckboxSelectMultiple(attrs={'id':'findMonths'}),choices=monthChoices)
+    def __init__(self,*args,**kwargs):
+      tagNames = kwargs.pop('tagNames',None)
+      super(FindForm,self).__init__(*args,**kwargs)
+      # read when the form is made, not when the module is imported, so new tags show up right away
+      if tagNames is None:
+        tagNames = Tag.objects.values_list('name', flat=True)
+      self.fields['tags'].choices = [(x,x) for x in tagNames]
+    tags = forms.MultipleChoiceField(required=False,label='return events with tag(s)',widget=forms.CheckboxSelectMultiple(attrs={'id':'findTags'}))
     textSearch = forms.CharField(required=False,label='return threads containing text')
     months = forms.MultipleChoiceField(required=False,label='get results from only these months',widget=forms.CheckboxSelectMultiple(attrs={'id':'findMonths'}),choices=monthChoices)
+    dateFrom = forms.DateField(required=False,label='get results from this date on (UTC)',widget=jqDateInput)
+    dateTo = forms.DateField(required=False,label='get results up to this date (UTC)',widget=jqDateInput)
@@ -0,0 +1,120 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import dateformat, timezone
+from .models import Event, EventUpdate
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Live updates for pages showing an event: new discussions in its threads, threads being frozen or
+# changed, and threads being added to or removed from it. Changes are written to EventUpdate in the
+# same transaction as the change itself, so every server process sees them. Waiting requests are woken
+# by an in-process condition when the change happens in their own process, and otherwise by the
+# modification time of a shared notification file, which is cheap to check; only then is the table read.
+
+notifyPath = getattr(settings, 'LIVE_UPDATES_FILE', os.path.join(tempfile.gettempdir(), 'weathredds-live-updates'))
+pollInterval = 0.5 # seconds between checks of the notification file
+retention = datetime.timedelta(hours=1) # updates older than this are deleted
+maxUpdates = 100 # per response
+
+_changed = threading.Condition()
+_generation = [0] # bumped on every local publish
+
+def publish(eventPks, kind, data):
+    "Record a change affecting the given events; waiting clients are told once the transaction commits."
+    eventPks = set(eventPks)
+    if not eventPks:
+        return
+    text = json.dumps(data)
+    prune()
+    EventUpdate.objects.bulk_create([EventUpdate(event_id=pk, kind=kind, data=text) for pk in eventPks])
+    transaction.on_commit(notify)
+
+def notify():
+    with _changed:
+        _generation[0] += 1
+        _changed.notify_all()
+    try:
+        with open(notifyPath, 'a'):
+            os.utime(notifyPath, None)
+    except (IOError, OSError):
+        pass # other processes fall back to their timeout
+
+def notifyMark():
+    try:
+        return os.stat(notifyPath).st_mtime
+    except OSError:
+        return None
+
+def latestUpdate():
+    "Primary key of the newest update, for pages to start following from."
+    return EventUpdate.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+def updatesAfter(eventPk, after):
+    return list(EventUpdate.objects.filter(event=eventPk, pk__gt=after).order_by('pk').values_list('pk', 'kind', 'data')[:maxUpdates])
+
+def waitForUpdates(eventPk, after, timeout):
+    '''
+    List of (pk, kind, data) updates for the event newer than after, waiting up to timeout seconds
+    for one to appear. Returns an empty list on timeout.
+    '''
+    deadline = time.time() + timeout
+    while True:
+        with _changed:
+            generation = _generation[0]
+        mark = notifyMark()
+        updates = updatesAfter(eventPk, after)
+        if updates:
+            return updates
+        # sleep until something is published, here or (judging by the file) in another process
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return []
+            with _changed:
+                if _generation[0] == generation:
+                    _changed.wait(min(pollInterval, remaining))
+                if _generation[0] != generation:
+                    break
+            if notifyMark() != mark:
+                break
+
+def prune():
+    EventUpdate.objects.filter(createdDate__lt=timezone.now() - retention).delete()
+
+# what is sent for each kind of change
+
+def discussionAdded(thread, discussion):
+    return {
+        'thread': thread.pk,
+        'author': discussion.author.username,
+        'createdDate': dateformat.format(discussion.createdDate, 'Hi\z D M j'),
+        'text': discussion.text,
+    }
+
+def threadChanged(thread):
+    return {'thread': thread.pk, 'title': thread.title, 'isExtensible': thread.isExtensible}
+
+def threadAssociated(threadPk, added):
+    return {'thread': threadPk, 'added': added}
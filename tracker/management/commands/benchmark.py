@@ -0,0 +1,82 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from tracker.benchmark.generate import Volumes, generate
+from tracker.benchmark.scenarios import scenarios, runScenarios
+import django
+import datetime
+import json
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = '''Build a test database filled with seeded synthetic data, time requests to the views through the
+test client, and write latency percentiles and SQL query counts per scenario as JSON.'''
+
+    def add_arguments(self, parser):
+        defaults = Volumes()
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=50, help='Timed requests per scenario.')
+        parser.add_argument('--scenario', action='append', choices=[name for name, _ in scenarios],
+            help='Run only this scenario (repeatable; default all).')
+        parser.add_argument('--output', '-o', help='File to write the JSON report to (default: standard output).')
+        for name, value in sorted(vars(defaults).items()):
+            parser.add_argument('--' + name, type=type(value), default=value, help='Generator volume (default {0}).'.format(value))
+
+    def handle(self, *args, **options):
+        volumes = Volumes(**dict((name, options[name]) for name in vars(Volumes())))
+        setup_test_environment()
+        settings.DEBUG = False
+        oldName = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # dashboard parts go to a cache of their own: the server's entries would carry the same keys
+        cacheOverride = override_settings(CACHES=dict(settings.CACHES, dashboard={
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark-dashboard',
+        }))
+        cacheOverride.enable()
+        try:
+            started = time.time()
+            dataset = generate(options['seed'], volumes)
+            generateSeconds = time.time() - started
+            results = runScenarios(dataset, random.Random(options['seed']), options['repeat'], options['scenario'])
+        finally:
+            cacheOverride.disable()
+            connection.creation.destroy_test_db(oldName, verbosity=0)
+            teardown_test_environment()
+        report = {
+            'date': datetime.datetime.utcnow().isoformat(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'volumes': vars(volumes),
+            'generateSeconds': generateSeconds,
+            'scenarios': results,
+        }
+        text = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                out.write(text + '\n')
+        else:
+            self.stdout.write(text)
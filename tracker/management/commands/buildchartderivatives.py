@@ -0,0 +1,77 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tracker.models import Chart
+from tracker.charts import hashFile, makeDerivatives
+import multiprocessing
+import time
+
+
+class Command(BaseCommand):
+    help = '''Generate thumbnails and web-sized copies of the chart images uploaded or replaced since the last run
+(or of every chart, with --all), and report images processed per second. Meant to be run from cron:
+saving a chart only marks it pending, so the web server never does this work itself.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'CHART_DERIVATIVE_WORKERS', multiprocessing.cpu_count()),
+            help='Number of worker processes (default: CHART_DERIVATIVE_WORKERS, or one per CPU).')
+        parser.add_argument('--all', action='store_true',
+            help='Process every chart, not only the pending ones.')
+        parser.add_argument('--force', action='store_true',
+            help='Regenerate derivatives that already exist.')
+
+    def handle(self, *args, **options):
+        charts = Chart.objects.exclude(image='')
+        if not options['all']:
+            charts = charts.filter(derivativesPending=True)
+        sources = {} # hash -> (path, chart pks)
+        for chart in charts.only('pk', 'image', 'imageHash').iterator():
+            try:
+                imageHash = hashFile(chart.image.path)
+            except (IOError, OSError) as e:
+                self.stderr.write('Chart {0:d}: cannot read {1:s}: {2}'.format(chart.pk, chart.image.name, e))
+                continue
+            if imageHash != chart.imageHash:
+                Chart.objects.filter(pk=chart.pk).update(imageHash=imageHash)
+            # identical uploads share derivatives, so each hash is only processed once
+            sources.setdefault(imageHash, (chart.image.path, []))[1].append(chart.pk)
+        workers = max(1, options['workers'])
+        started = time.time()
+        written = failed = 0
+        pool = multiprocessing.Pool(processes=workers)
+        try:
+            results = [(pks, pool.apply_async(makeDerivatives, (path, imageHash, settings.MEDIA_ROOT, options['force'])))
+                for imageHash, (path, pks) in sources.items()]
+            for pks, result in results:
+                try:
+                    written += result.get()
+                except Exception as e:
+                    # left pending, so the next run tries again
+                    failed += 1
+                    self.stderr.write('Charts {0:s}: {1}'.format(', '.join(str(pk) for pk in pks), e))
+                    continue
+                Chart.objects.filter(pk__in=pks).update(derivativesPending=False)
+        finally:
+            pool.close()
+            pool.join()
+        elapsed = time.time() - started
+        rate = len(sources) / elapsed if elapsed > 0 else 0.0
+        self.stdout.write('Processed {0:d} charts ({1:d} files written, {2:d} failed) in {3:.2f} s, {4:.1f} images/s with {5:d} workers.'.format(
+            len(sources), written, failed, elapsed, rate, workers))
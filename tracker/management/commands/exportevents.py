@@ -0,0 +1,57 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from tracker.export import exportEvents, exportRecords, ndjsonLines, gzipChunks, exportChunkSize
+import datetime
+import pytz
+import re
+
+
+class Command(BaseCommand):
+    help = 'Write events with their threads, discussions, tags and authors as NDJSON (one event per line).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='timeFrom', help='Start of period, YYYYMMDD_HHMM (UTC); needs --to.')
+        parser.add_argument('--to', dest='timeTo', help='End of period, YYYYMMDD_HHMM (UTC); needs --from.')
+        parser.add_argument('--tag', action='append', default=[], help='Only events with this tag (repeatable; events with any of them).')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output.')
+        parser.add_argument('--output', '-o', help='File to write (default: standard output).')
+        parser.add_argument('--chunk-size', type=int, default=exportChunkSize, help='Events fetched per query batch.')
+
+    def handle(self, *args, **options):
+        timeFrom = timeTo = None
+        if options['timeFrom'] or options['timeTo']:
+            timePattern = re.compile(r'^(\d{4})-?(\d\d)-?(\d\d)_(\d\d):?(\d\d)$')
+            tF = timePattern.match(options['timeFrom'] or '')
+            tT = timePattern.match(options['timeTo'] or '')
+            if not (tF and tT):
+                raise CommandError('--from and --to must both be given, as YYYYMMDD_HHMM.')
+            timeFrom = datetime.datetime(*[int(x, 10) for x in tF.groups()], tzinfo=pytz.UTC)
+            timeTo = datetime.datetime(*[int(x, 10) for x in tT.groups()], tzinfo=pytz.UTC)
+        chunks = ndjsonLines(exportRecords(exportEvents(timeFrom, timeTo, options['tag']), options['chunk_size']))
+        if options['gzip']:
+            chunks = gzipChunks(chunks)
+        if options['output']:
+            with open(options['output'], 'wb') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            for chunk in chunks:
+                # no line ending added, so lines and gzip data pass through unchanged
+                self.stdout.write(chunk, ending='')
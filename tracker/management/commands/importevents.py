@@ -0,0 +1,251 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from tracker import dashboard
+from tracker.models import Discussion, Thread, Event, Tag, ImportProgress, ImportedId, ThreadActivity, bumpDataVersion
+from itertools import islice
+import csv
+import json
+import os
+import time
+
+# Columns of a CSV import, one row per discussion. Consecutive rows with the same 'event' (or, without
+# that column, 'eventTitle') form one event; within it, rows with the same 'thread' (or 'threadTitle')
+# form one thread; a 'thread' value seen again under another event refers to the same thread.
+# 'tags' is a semicolon-separated list.
+csvColumns = ('event', 'eventTitle', 'owner', 'startDate', 'endDate', 'isPublic', 'isPermanent', 'tags',
+    'thread', 'threadTitle', 'validDate', 'isExtensible', 'author', 'createdDate', 'text')
+
+
+class Command(BaseCommand):
+    help = '''Load events with their threads and discussions from NDJSON (the format written by exportevents)
+or CSV (one row per discussion, columns: {0:s}). Rows are written with bulk inserts, one transaction
+per batch of events; progress is committed with each batch, so rerunning the same command after a failure
+continues where it stopped. Threads and discussions are matched by their id in the source (the 'id' fields
+of exportevents, the 'thread' column of a CSV), so one shared by several events is created only once.
+Run it while the site is quiet: primary keys are allocated by the importer.'''.format(', '.join(csvColumns))
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import (.ndjson/.json or .csv).')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=100, help='Events committed per transaction.')
+        parser.add_argument('--restart', action='store_true', help='Ignore recorded progress and import the whole file again.')
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        fileFormat = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        batchSize = max(1, options['batch_size'])
+        progress, _ = ImportProgress.objects.get_or_create(source=path)
+        if options['restart']:
+            ImportProgress.objects.filter(pk=progress.pk).update(recordsDone=0)
+            progress.importedIds.all().delete()
+            progress.recordsDone = 0
+        elif progress.recordsDone:
+            self.stdout.write('Resuming after {0:d} records.'.format(progress.recordsDone))
+        self.progress = progress
+        # source id -> primary key of the threads and discussions already imported from this source
+        self.importedIds = {'thread': {}, 'discussion': {}}
+        for model, sourceId, targetId in progress.importedIds.values_list('model', 'sourceId', 'targetId').iterator():
+            self.importedIds[model][sourceId] = targetId
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.tags = set(Tag.objects.values_list('name', flat=True))
+        with open(path, 'rb') as f:
+            records = csvRecords(f) if fileFormat == 'csv' else ndjsonRecords(f)
+            records = islice(records, progress.recordsDone, None)
+            started = time.time()
+            totalRecords = totalRows = 0
+            while True:
+                batch = list(islice(records, batchSize))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    rows = self.importBatch(batch)
+                    ImportProgress.objects.filter(pk=progress.pk).update(recordsDone=progress.recordsDone + len(batch))
+                progress.recordsDone += len(batch)
+                totalRecords += len(batch)
+                totalRows += rows
+                elapsed = time.time() - started
+                self.stdout.write('{0:d} records done, {1:d} rows inserted, {2:.0f} rows/s'.format(
+                    progress.recordsDone, totalRows, totalRows / elapsed if elapsed > 0 else 0.0))
+        # explicit primary keys leave sequences behind on backends that have them
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Event, Thread, Discussion]):
+                cursor.execute(sql)
+        elapsed = time.time() - started
+        self.stdout.write('Imported {0:d} events ({1:d} rows) in {2:.2f} s, {3:.0f} rows/s.'.format(
+            totalRecords, totalRows, elapsed, totalRows / elapsed if elapsed > 0 else 0.0))
+
+    def importBatch(self, batch):
+        "Insert the events in batch (dicts as produced by exportevents) and return the number of rows written."
+        nextEvent, nextThread, nextDiscussion = [nextPk(model) for model in (Event, Thread, Discussion)]
+        events, threads, discussions = [], [], []
+        eventThreads, threadDiscussions, tagEvents = [], [], []
+        newTags = set()
+        newIds = []
+        activity = {} # (author, thread) -> latest discussion date, as kept in ThreadActivity
+        for record in batch:
+            event = Event(pk=nextEvent, title=record['title'], owner_id=self.userPk(record['owner']),
+                startDate=parseDate(record.get('startDate')), endDate=parseDate(record.get('endDate')),
+                isPublic=bool(record.get('isPublic')), isPermanent=bool(record.get('isPermanent')))
+            if record.get('createdDate'):
+                event.createdDate = parseDate(record['createdDate'])
+            events.append(event)
+            nextEvent += 1
+            for tagName in record.get('tags', []):
+                if tagName not in self.tags:
+                    newTags.add(tagName)
+                    self.tags.add(tagName)
+                tagEvents.append(Tag.events.through(tag_id=tagName, event_id=event.pk))
+            eventThreadPks = set()
+            for threadRecord in record.get('threads', []):
+                threadPk = self.importedId('thread', threadRecord.get('id'))
+                if threadPk is not None:
+                    # already imported with another event: only the association is new
+                    if threadPk not in eventThreadPks:
+                        eventThreadPks.add(threadPk)
+                        eventThreads.append(Event.threads.through(event_id=event.pk, thread_id=threadPk))
+                    continue
+                thread = Thread(pk=nextThread, title=threadRecord['title'], validDate=parseDate(threadRecord['validDate']),
+                    isExtensible=threadRecord.get('isExtensible', True))
+                thread.setCalendar()
+                threads.append(thread)
+                nextThread += 1
+                newIds += self.recordImportedId('thread', threadRecord.get('id'), thread.pk)
+                eventThreadPks.add(thread.pk)
+                eventThreads.append(Event.threads.through(event_id=event.pk, thread_id=thread.pk))
+                for discussionRecord in threadRecord.get('discussions', []):
+                    discussion = Discussion(author_id=self.userPk(discussionRecord['author']),
+                        createdDate=parseDate(discussionRecord['createdDate']), text=discussionRecord['text'])
+                    discussion.pk = self.importedId('discussion', discussionRecord.get('id'))
+                    if discussion.pk is None:
+                        discussion.pk = nextDiscussion
+                        discussions.append(discussion)
+                        nextDiscussion += 1
+                        newIds += self.recordImportedId('discussion', discussionRecord.get('id'), discussion.pk)
+                    threadDiscussions.append(Thread.discussions.through(thread_id=thread.pk, discussion_id=discussion.pk))
+                    if thread.steward_id is None:
+                        # steward is the author of the first discussion, as kept by signals.py for other threads
+                        thread.steward_id = discussion.author_id
+                    thread.discussionCount += 1
+                    if thread.lastActivity is None or discussion.createdDate > thread.lastActivity:
+                        thread.lastActivity = discussion.createdDate
+                    key = (discussion.author_id, thread.pk)
+                    if key not in activity or discussion.createdDate > activity[key]:
+                        activity[key] = discussion.createdDate
+        # bulk_create skips the receivers in signals.py, so their bookkeeping is done explicitly below
+        Tag.objects.bulk_create([Tag(name=name) for name in newTags])
+        Discussion.objects.bulk_create(discussions)
+        Thread.objects.bulk_create(threads)
+        Event.objects.bulk_create(events)
+        Thread.discussions.through.objects.bulk_create(threadDiscussions)
+        Event.threads.through.objects.bulk_create(eventThreads)
+        Tag.events.through.objects.bulk_create(tagEvents)
+        ThreadActivity.objects.bulk_create([ThreadActivity(author_id=author, thread_id=thread, lastActivity=date)
+            for ((author, thread), date) in activity.items()])
+        ImportedId.objects.bulk_create(newIds)
+        Event.objects.filter(pk__in=[e.pk for e in events]).refreshThreadStats()
+        for tag in Tag.objects.filter(pk__in=set(te.tag_id for te in tagEvents)):
+            tag.refreshEventCount()
+        bumpDataVersion()
+        dashboard.bumpForEvents(Event.objects.filter(pk__in=[e.pk for e in events]))
+        dashboard.bumpForThreads([t.pk for t in threads])
+        dashboard.bump('tags')
+        return len(newTags) + len(discussions) + len(threads) + len(events) + len(threadDiscussions) + len(eventThreads) + len(tagEvents) + len(activity) + len(newIds)
+
+    def importedId(self, model, sourceId):
+        "Primary key already given to the thread or discussion with this source id, or None."
+        if sourceId is None:
+            return None
+        return self.importedIds[model].get(unicode(sourceId))
+
+    def recordImportedId(self, model, sourceId, targetId):
+        "Remember the primary key given to a new thread or discussion; returns the ImportedId rows to save with the batch."
+        if sourceId is None:
+            return []
+        self.importedIds[model][unicode(sourceId)] = targetId
+        return [ImportedId(progress=self.progress, model=model, sourceId=unicode(sourceId), targetId=targetId)]
+
+    def userPk(self, username):
+        if username not in self.users:
+            # historical authors get accounts that cannot log in until someone sets a password
+            user = User(username=username)
+            user.set_unusable_password()
+            user.save()
+            self.users[username] = user.pk
+        return self.users[username]
+
+def nextPk(model):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+def parseDate(value):
+    if not value:
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        raise CommandError('Not a date and time: {0:s}'.format(value))
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, timezone.utc)
+    return dt
+
+def ndjsonRecords(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+def csvRecords(f):
+    record = thread = None
+    for row in csv.DictReader(f):
+        row = dict((k, v.decode('utf-8')) for (k, v) in row.items() if k and v is not None)
+        eventKey = row.get('event') or row['eventTitle']
+        threadKey = row.get('thread') or row['threadTitle']
+        if record is None or record['key'] != eventKey:
+            if record is not None:
+                yield record
+            record = {
+                'key': eventKey,
+                'title': row['eventTitle'],
+                'owner': row['owner'],
+                'startDate': row.get('startDate'),
+                'endDate': row.get('endDate'),
+                'isPublic': row.get('isPublic', '').lower() in ('1', 'true', 'yes'),
+                'isPermanent': row.get('isPermanent', '').lower() in ('1', 'true', 'yes'),
+                'tags': [t.strip() for t in row.get('tags', '').split(';') if t.strip()],
+                'threads': [],
+            }
+            thread = None
+        if thread is None or thread['key'] != threadKey:
+            thread = {
+                'key': threadKey,
+                'id': row.get('thread'),
+                'title': row['threadTitle'],
+                'validDate': row['validDate'],
+                'isExtensible': row.get('isExtensible', 'true').lower() in ('1', 'true', 'yes'),
+                'discussions': [],
+            }
+            record['threads'].append(thread)
+        if row.get('text'):
+            thread['discussions'].append({'author': row['author'], 'createdDate': row['createdDate'], 'text': row['text']})
+    if record is not None:
+        yield record
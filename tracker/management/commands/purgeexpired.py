@@ -0,0 +1,143 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+from tracker import dashboard
+from tracker.models import Discussion, Thread, Event, EventTimeBucket, EventMonthBucket, EventUpdate, Pin, Tag, ThreadActivity, bumpDataVersion
+import datetime
+import os
+
+
+class Command(BaseCommand):
+    help = '''Delete events not marked permanent whose time range ended more than --days ago, together with their pins,
+threads older than that which belong to no remaining event, and discussions left without a thread.
+Rows are deleted in batches, one short transaction each. Meant to be run from cron.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Age in days after which a non-permanent event expires.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows of each kind deleted per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+        parser.add_argument('--vacuum', action='store_true', help='Run VACUUM and ANALYZE afterwards.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        batchSize = max(1, options['batch_size'])
+        events, threads, discussions = expiredRows(cutoff)
+        pins = Pin.objects.filter(event__in=events)
+        numDiscussions = discussions.count()
+        textLength = sum(size or 0 for size in (
+            events.aggregate(size=Sum(Length('title')))['size'],
+            threads.aggregate(size=Sum(Length('title')))['size'],
+            discussions.aggregate(size=Sum(Length('text')))['size'],
+        ))
+        verb = 'Would delete' if options['dry_run'] else 'Deleting'
+        self.stdout.write('{0:s} {1:d} events, {2:d} pins, {3:d} threads and {4:d} discussions older than {5:s} ({6:d} characters of text).'.format(
+            verb, events.count(), pins.count(), threads.count(), numDiscussions, cutoff.strftime('%Y-%m-%d %H:%Mz'), textLength))
+        if options['dry_run']:
+            return
+        sizeBefore = databaseSize()
+        numEvents = deleteInBatches(events, batchSize, deleteEvents)
+        numThreads = deleteInBatches(threads, batchSize, deleteThreads)
+        # discussions of the deleted threads went with them; this picks up any that were already loose
+        deleteInBatches(discussions, batchSize, deleteDiscussions)
+        self.stdout.write('Deleted {0:d} events, {1:d} threads and {2:d} discussions.'.format(numEvents, numThreads, numDiscussions))
+        if options['vacuum']:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'sqlite':
+                    cursor.execute('VACUUM')
+                    cursor.execute('ANALYZE')
+                elif connection.vendor == 'postgresql':
+                    # outside atomic() Django is in autocommit mode, which VACUUM requires
+                    cursor.execute('VACUUM ANALYZE')
+                else:
+                    cursor.execute('ANALYZE TABLE tracker_event, tracker_thread, tracker_discussion')
+        sizeAfter = databaseSize()
+        if sizeBefore is not None:
+            self.stdout.write('Database file went from {0:d} to {1:d} bytes ({2:d} reclaimed).'.format(
+                sizeBefore, sizeAfter, sizeBefore - sizeAfter))
+
+def expiredRows(cutoff):
+    '''
+    Querysets of expired events, of the old threads that belong to no other event, and of the discussions
+    that belong only to those threads (or to no thread at all, if older than cutoff).
+    '''
+    events = Event.objects.filter(isPermanent=False).filter(
+        Q(effectiveEnd__lt=cutoff) | Q(effectiveEnd__isnull=True, createdDate__lt=cutoff))
+    keptLinks = Event.threads.through.objects.exclude(event__in=events)
+    threads = Thread.objects.filter(validDate__lt=cutoff).exclude(pk__in=keptLinks.values('thread'))
+    links = Thread.discussions.through.objects
+    discussions = Discussion.objects.exclude(pk__in=links.exclude(thread__in=threads).values('discussion')).filter(
+        Q(pk__in=links.filter(thread__in=threads).values('discussion')) | Q(createdDate__lt=cutoff))
+    return events, threads, discussions
+
+def deleteInBatches(queryset, batchSize, deleteBatch):
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batchSize])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            deleteBatch(pks)
+            bumpDataVersion()
+        deleted += len(pks)
+
+# Rows are removed with single DELETE statements (QuerySet._raw_delete, the fast path Django's own
+# collector uses) rather than QuerySet.delete(), which would load every row to send the per-object
+# signals in signals.py. Their bookkeeping is done here instead.
+
+def deleteEvents(pks):
+    dashboard.bumpForEvents(Event.objects.filter(pk__in=pks))
+    dashboard.bump('tags')
+    tagNames = set(Tag.events.through.objects.filter(event__in=pks).values_list('tag', flat=True))
+    for model, field in ((Pin, 'event'), (EventTimeBucket, 'event'), (EventMonthBucket, 'event'), (EventUpdate, 'event'),
+            (Tag.events.through, 'event'), (Event.threads.through, 'event')):
+        rawDelete(model.objects.filter(**{field + '__in': pks}))
+    rawDelete(Event.objects.filter(pk__in=pks))
+    for tag in Tag.objects.filter(pk__in=tagNames):
+        tag.refreshEventCount()
+
+def deleteThreads(pks):
+    dashboard.bumpForThreads(pks)
+    links = Thread.discussions.through.objects
+    discussionPks = list(links.filter(thread__in=pks).exclude(
+        discussion__in=links.exclude(thread__in=pks).values('discussion')).values_list('discussion', flat=True).distinct())
+    # the threads go first, so the search index triggers on the link table find nothing to rebuild
+    rawDelete(Thread.objects.filter(pk__in=pks))
+    rawDelete(links.filter(thread__in=pks))
+    rawDelete(Event.threads.through.objects.filter(thread__in=pks))
+    rawDelete(ThreadActivity.objects.filter(thread__in=pks))
+    rawDelete(Discussion.objects.filter(pk__in=discussionPks))
+
+def deleteDiscussions(pks):
+    rawDelete(Thread.discussions.through.objects.filter(discussion__in=pks))
+    rawDelete(Discussion.objects.filter(pk__in=pks))
+
+def rawDelete(queryset):
+    queryset._raw_delete(queryset.db)
+
+def databaseSize():
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        return os.path.getsize(connection.settings_dict['NAME'])
+    except OSError:
+        return None
@@ -0,0 +1,33 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from tracker.search import rebuildIndex, installTriggers
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of thread titles and discussions, and the triggers that maintain it.'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The search index is only used with SQLite.')
+        with transaction.atomic():
+            installTriggers()
+            count = rebuildIndex()
+        self.stdout.write('Indexed {0:d} threads.'.format(count))
@@ -0,0 +1,35 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from tracker.models import Tag
+
+
+class Command(BaseCommand):
+    help = 'Recompute the number of events stored on every tag.'
+
+    def handle(self, *args, **options):
+        fixed = 0
+        with transaction.atomic():
+            for tag in Tag.objects.annotate(numEvents=Count('events')):
+                if tag.eventCount != tag.numEvents:
+                    Tag.objects.filter(pk=tag.pk).update(eventCount=tag.numEvents)
+                    fixed += 1
+        self.stdout.write('Corrected {0:d} tags.'.format(fixed))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:17
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def setStewards(apps, schema_editor):
+    # steward is the author of the discussion with the lowest pk in each thread
+    Thread = apps.get_model('tracker', 'Thread')
+    Discussion = apps.get_model('tracker', 'Discussion')
+    firstDiscos = dict(Thread.objects.annotate(firstDisco=models.Min('discussions__pk')).filter(firstDisco__isnull=False).values_list('pk', 'firstDisco'))
+    authors = dict(Discussion.objects.filter(pk__in=firstDiscos.values()).values_list('pk', 'author'))
+    for threadPk, discoPk in firstDiscos.items():
+        Thread.objects.filter(pk=threadPk).update(steward=authors[discoPk])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracker', '0008_thread_isextensible'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='steward',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stewardedThreads', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='startDate',
+            field=models.DateTimeField(blank=True, null=True, verbose_name=b'start date (if blank, event time range is defined by that of threads)'),
+        ),
+        migrations.RunPython(setStewards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def setThreadStats(apps, schema_editor):
+    Event = apps.get_model('tracker', 'Event')
+    for event in Event.objects.all():
+        dates = list(event.threads.order_by('validDate').values_list('validDate', flat=True))
+        if event.startDate and event.endDate:
+            start, end = event.startDate, event.endDate
+        elif dates:
+            start, end = dates[0], dates[-1]
+        else:
+            start, end = None, None
+        Event.objects.filter(pk=event.pk).update(effectiveStart=start, effectiveEnd=end, threadCount=len(dates))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0009_thread_steward'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='effectiveEnd',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='effectiveStart',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='threadCount',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(setThreadStats, migrations.RunPython.noop),
+    ]
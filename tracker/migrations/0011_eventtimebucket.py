@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:19
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import datetime
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def fillBuckets(apps, schema_editor):
+    Event = apps.get_model('tracker', 'Event')
+    EventTimeBucket = apps.get_model('tracker', 'EventTimeBucket')
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+    for event in Event.objects.filter(effectiveStart__isnull=False):
+        first, last = (event.effectiveStart - epoch).days, (event.effectiveEnd - epoch).days
+        EventTimeBucket.objects.bulk_create([EventTimeBucket(event=event, day=d) for d in range(first, last + 1)])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0010_event_threadstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventTimeBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.IntegerField()),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tracker.Event')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventtimebucket',
+            unique_together=set([('day', 'event')]),
+        ),
+        migrations.RunPython(fillBuckets, migrations.RunPython.noop),
+    ]
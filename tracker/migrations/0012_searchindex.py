@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# One FTS5 row per thread (rowid = thread id) holding its title and the text of all its discussions.
+# Triggers rebuild a thread's row whenever its title, its set of discussions, or one of those
+# discussions' text changes, so bulk inserts and admin edits are covered as well as the views.
+
+def documentSql(threadIdCondition):
+    return '''
+    DELETE FROM tracker_searchindex WHERE rowid {0};
+    INSERT INTO tracker_searchindex(rowid, title, body)
+        SELECT t.id, t.title, coalesce((SELECT group_concat(d.text, char(10))
+            FROM tracker_discussion d INNER JOIN tracker_thread_discussions td ON td.discussion_id = d.id
+            WHERE td.thread_id = t.id), '')
+        FROM tracker_thread t WHERE t.id {0};
+    '''.format(threadIdCondition)
+
+forwardSql = [
+    "CREATE VIRTUAL TABLE tracker_searchindex USING fts5(title, body, tokenize='porter unicode61')",
+    "CREATE TRIGGER tracker_searchindex_thread_ins AFTER INSERT ON tracker_thread BEGIN {0} END".format(documentSql('= new.id')),
+    "CREATE TRIGGER tracker_searchindex_thread_upd AFTER UPDATE OF title ON tracker_thread BEGIN {0} END".format(documentSql('= new.id')),
+    "CREATE TRIGGER tracker_searchindex_thread_del AFTER DELETE ON tracker_thread BEGIN DELETE FROM tracker_searchindex WHERE rowid = old.id; END",
+    "CREATE TRIGGER tracker_searchindex_link_ins AFTER INSERT ON tracker_thread_discussions BEGIN {0} END".format(documentSql('= new.thread_id')),
+    "CREATE TRIGGER tracker_searchindex_link_del AFTER DELETE ON tracker_thread_discussions BEGIN {0} END".format(documentSql('= old.thread_id')),
+    "CREATE TRIGGER tracker_searchindex_disco_upd AFTER UPDATE OF text ON tracker_discussion BEGIN {0} END".format(
+        documentSql('IN (SELECT thread_id FROM tracker_thread_discussions WHERE discussion_id = new.id)')),
+    "INSERT INTO tracker_searchindex(rowid, title, body) SELECT t.id, t.title, coalesce((SELECT group_concat(d.text, char(10)) "
+        "FROM tracker_discussion d INNER JOIN tracker_thread_discussions td ON td.discussion_id = d.id WHERE td.thread_id = t.id), '') "
+        "FROM tracker_thread t",
+]
+
+reverseSql = [
+    'DROP TRIGGER IF EXISTS tracker_searchindex_thread_ins',
+    'DROP TRIGGER IF EXISTS tracker_searchindex_thread_upd',
+    'DROP TRIGGER IF EXISTS tracker_searchindex_thread_del',
+    'DROP TRIGGER IF EXISTS tracker_searchindex_link_ins',
+    'DROP TRIGGER IF EXISTS tracker_searchindex_link_del',
+    'DROP TRIGGER IF EXISTS tracker_searchindex_disco_upd',
+    'DROP TABLE IF EXISTS tracker_searchindex',
+]
+
+def createIndex(apps, schema_editor):
+    # FTS5 is specific to SQLite; other backends fall back to icontains in tracker.search
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in forwardSql:
+        schema_editor.execute(statement)
+
+def dropIndex(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in reverseSql:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0011_eventtimebucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(createIndex, dropIndex),
+    ]
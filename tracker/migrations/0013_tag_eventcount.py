@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:21
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def setEventCounts(apps, schema_editor):
+    Tag = apps.get_model('tracker', 'Tag')
+    for tag in Tag.objects.annotate(numEvents=models.Count('events')):
+        Tag.objects.filter(pk=tag.pk).update(eventCount=tag.numEvents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_searchindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='eventCount',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(setEventCounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0015_event_effectivestart_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='discussion',
+            name='createdDate',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='thread',
+            name='validDate',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0016_activity_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chart',
+            name='imageHash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0019_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventUpdate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('createdDate', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('kind', models.CharField(max_length=16)),
+                ('data', models.TextField()),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tracker.Event')),
+            ],
+        ),
+    ]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:39
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def setActivity(apps, schema_editor):
+    Thread = apps.get_model('tracker', 'Thread')
+    ThreadActivity = apps.get_model('tracker', 'ThreadActivity')
+    latest = {} # thread -> author -> newest discussion
+    counts = {}
+    for thread, createdDate, author in Thread.discussions.through.objects.values_list('thread', 'discussion__createdDate', 'discussion__author').iterator():
+        byAuthor = latest.setdefault(thread, {})
+        if author not in byAuthor or createdDate > byAuthor[author]:
+            byAuthor[author] = createdDate
+        counts[thread] = counts.get(thread, 0) + 1
+    activity = []
+    for thread, byAuthor in latest.items():
+        Thread.objects.filter(pk=thread).update(lastActivity=max(byAuthor.values()), discussionCount=counts[thread])
+        activity += [ThreadActivity(thread_id=thread, author_id=author, lastActivity=date) for (author, date) in byAuthor.items()]
+    ThreadActivity.objects.bulk_create(activity, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracker', '0020_eventupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lastActivity', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='threadActivity', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='discussionCount',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='lastActivity',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='thread',
+            index_together=set([('discussionCount', 'lastActivity')]),
+        ),
+        migrations.AddField(
+            model_name='threadactivity',
+            name='thread',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='tracker.Thread'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='threadactivity',
+            unique_together=set([('author', 'thread')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='threadactivity',
+            index_together=set([('author', 'lastActivity')]),
+        ),
+        migrations.RunPython(setActivity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:43
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Many-to-many tables only get a unique index in the declared direction (plus one per column);
+# these cover lookups in the reverse direction (events of a thread, threads of a discussion,
+# tags of an event) without a trip to the table. Django 1.9 cannot declare indexes on auto-created
+# through tables, so they are created here by hand.
+
+reverseIndexes = [
+    ('tracker_event_threads_thread_event', 'tracker_event_threads', ('thread_id', 'event_id')),
+    ('tracker_thread_discussions_discussion_thread', 'tracker_thread_discussions', ('discussion_id', 'thread_id')),
+    ('tracker_tag_events_event_tag', 'tracker_tag_events', ('event_id', 'tag_id')),
+]
+
+def createReverseIndexes(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for name, table, columns in reverseIndexes:
+        schema_editor.execute('CREATE INDEX {0} ON {1} ({2})'.format(quote(name), quote(table), ', '.join(quote(c) for c in columns)))
+
+def dropReverseIndexes(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for name, table, columns in reverseIndexes:
+        if schema_editor.connection.vendor == 'mysql':
+            schema_editor.execute('DROP INDEX {0} ON {1}'.format(quote(name), quote(table)))
+        else:
+            schema_editor.execute('DROP INDEX {0}'.format(quote(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0021_thread_activity'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('isPublic', 'owner')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='thread',
+            index_together=set([('steward', 'validDate'), ('discussionCount', 'lastActivity')]),
+        ),
+        migrations.RunPython(createReverseIndexes, dropReverseIndexes),
+    ]
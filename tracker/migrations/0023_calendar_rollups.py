@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def season(month):
+    return ('winter', 'spring', 'summer', 'autumn')[month % 12 // 3]
+
+def fillCalendar(apps, schema_editor):
+    Thread = apps.get_model('tracker', 'Thread')
+    Event = apps.get_model('tracker', 'Event')
+    EventMonthBucket = apps.get_model('tracker', 'EventMonthBucket')
+    threadsByMonth = {}
+    for pk, validDate in Thread.objects.values_list('pk', 'validDate').iterator():
+        validDate = validDate.astimezone(timezone.utc)
+        threadsByMonth.setdefault((validDate.year, validDate.month), []).append(pk)
+    for (year, month), pks in threadsByMonth.items():
+        for i in range(0, len(pks), 500):
+            Thread.objects.filter(pk__in=pks[i:i + 500]).update(validYear=year, validMonth=month, validSeason=season(month))
+    buckets = []
+    for pk, start, end in Event.objects.filter(effectiveStart__isnull=False).values_list('pk', 'effectiveStart', 'effectiveEnd').iterator():
+        start, end = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+        for n in range(start.year * 12 + start.month - 1, end.year * 12 + end.month):
+            buckets.append(EventMonthBucket(event_id=pk, year=n // 12, month=n % 12 + 1, season=season(n % 12 + 1)))
+    EventMonthBucket.objects.bulk_create(buckets, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0022_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventMonthBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(db_index=True)),
+                ('month', models.PositiveSmallIntegerField(db_index=True)),
+                ('season', models.CharField(choices=[(b'winter', b'Winter (DJF)'), (b'spring', b'Spring (MAM)'), (b'summer', b'Summer (JJA)'), (b'autumn', b'Autumn (SON)')], db_index=True, max_length=6)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tracker.Event')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='validMonth',
+            field=models.PositiveSmallIntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='validSeason',
+            field=models.CharField(blank=True, choices=[(b'winter', b'Winter (DJF)'), (b'spring', b'Spring (MAM)'), (b'summer', b'Summer (JJA)'), (b'autumn', b'Autumn (SON)')], db_index=True, editable=False, max_length=6),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='validYear',
+            field=models.PositiveSmallIntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventmonthbucket',
+            unique_together=set([('event', 'year', 'month')]),
+        ),
+        migrations.RunPython(fillCalendar, migrations.RunPython.noop),
+    ]
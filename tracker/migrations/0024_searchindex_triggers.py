@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Migration 0012 created the search index triggers. When a later migration remakes tracker_thread or
+# tracker_discussion, SQLite leaves them pointing at the dropped copy of the table, so they are dropped
+# here, before the first such migration (0014) runs; tracker.search.installTriggers recreates them
+# on post_migrate, once the tables are in their final shape.
+
+triggerNames = [
+    'tracker_searchindex_thread_ins',
+    'tracker_searchindex_thread_upd',
+    'tracker_searchindex_thread_del',
+    'tracker_searchindex_link_ins',
+    'tracker_searchindex_link_del',
+    'tracker_searchindex_disco_upd',
+]
+
+def dropTriggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in triggerNames:
+        schema_editor.execute('DROP TRIGGER IF EXISTS {0}'.format(name))
+
+def restoreTriggers(apps, schema_editor):
+    from tracker.search import installTriggers
+    installTriggers(using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_searchindex'),
+    ]
+
+    run_before = [
+        ('tracker', '0014_thread_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(dropTriggers, restoreTriggers),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0023_calendar_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chart',
+            name='derivativesPending',
+            field=models.BooleanField(db_index=True, default=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 16:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0025_chart_derivativespending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedId',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=16)),
+                ('sourceId', models.CharField(max_length=64)),
+                ('targetId', models.PositiveIntegerField()),
+                ('progress', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='importedIds', to='tracker.ImportProgress')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='importedid',
+            unique_together=set([('progress', 'model', 'sourceId')]),
+        ),
+    ]
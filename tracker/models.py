@@ -16,11 +16,40 @@
     You should have received a copy of the GNU General Public License
     along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
 """
+import datetime
 from django.db import models
+from django.core.files.storage import default_storage
+from django.db.models import Q, F
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 dateFormatStr = '%H%Mz %a %b %d'
+epoch = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def dayNumber(dt):
+    # UTC day index used by EventTimeBucket
+    return (dt - epoch).days
+
+# meteorological seasons (northern hemisphere); winter is December to February
+seasonChoices = (('winter', 'Winter (DJF)'), ('spring', 'Spring (MAM)'), ('summer', 'Summer (JJA)'), ('autumn', 'Autumn (SON)'))
+
+def seasonOf(month):
+    return seasonChoices[month % 12 // 3][0]
+
+def calendarBucket(dt):
+    # (year, month, season) of a time in UTC, as stored for the review rollups
+    dt = dt.astimezone(timezone.utc)
+    return (dt.year, dt.month, seasonOf(dt.month))
+
+def monthsSpanned(start, end):
+    "List of (year, month) touched by the period start..end, in UTC."
+    start, end = start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
 
 # class UserInterface(models.Model):
 # https://docs.djangoproject.com/en/1.9/topics/auth/customizing/#extending-user
@@ -42,24 +71,140 @@ class Chart(models.Model):
     description = models.TextField()
     image = models.ImageField(upload_to='charts')
     isArchived = models.BooleanField(default=False)
+    # SHA-1 of the image file; derivatives (see tracker.charts) are stored under this name
+    imageHash = models.CharField(max_length=40, blank=True, editable=False)
+    # set when the image is uploaded or replaced, cleared by 'manage.py buildchartderivatives'
+    derivativesPending = models.BooleanField(default=True, editable=False, db_index=True)
+
+    def derivativeUrl(self, size):
+        from .charts import derivativeName
+        if self.derivativesPending or not self.imageHash:
+            # not generated yet; the original will do in the meantime
+            return self.image.url
+        return default_storage.url(derivativeName(self.imageHash, size))
+
+    def thumbnailUrl(self):
+        return self.derivativeUrl('thumb')
+
+    def webUrl(self):
+        return self.derivativeUrl('web')
 
 class Discussion(models.Model):
     author = models.ForeignKey('auth.User')
-    createdDate = models.DateTimeField(default=timezone.now)
+    createdDate = models.DateTimeField(default=timezone.now, db_index=True)
     text = models.TextField()
 
     def __str__(self):
         return self.author.username + ', ' + self.createdDate.strftime(dateFormatStr)
 
+class ThreadQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        # a thread is visible to its steward, and to everyone once it is part of a public event
+        publicThreads = Event.threads.through.objects.filter(event__isPublic=True).values('thread')
+        if not user.is_authenticated():
+            return self.filter(pk__in=publicThreads)
+        return self.filter(Q(steward=user) | Q(pk__in=publicThreads))
+
+    def mostActive(self):
+        # by number of discussions, then by latest discussion; walks the (discussionCount, lastActivity) index
+        return self.order_by('-discussionCount', '-lastActivity')
+
+    def recentlyActive(self, since):
+        return self.filter(lastActivity__gte=since).order_by('-lastActivity')
+
 class Thread(models.Model):
     title = models.TextField()
-    validDate = models.DateTimeField(default=timezone.now)
+    validDate = models.DateTimeField(default=timezone.now, db_index=True)
     discussions = models.ManyToManyField(Discussion, blank=True)
     isExtensible = models.BooleanField(default=True)
+    # the author of the first discussion is considered the "owner" or "steward" of the thread;
+    # stored here so access checks don't need to look at the discussions
+    steward = models.ForeignKey('auth.User', null=True, blank=True, related_name='stewardedThreads', on_delete=models.SET_NULL)
+
+    # incremented whenever the thread's rendered block may change (see signals.py), to key its cache entry
+    version = models.PositiveIntegerField(default=0, editable=False)
+    # creation date of the newest discussion, and number of discussions, for activity feeds;
+    # kept up to date (with the per-author ThreadActivity rows) by refreshActivity, called from signals.py
+    lastActivity = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+    discussionCount = models.PositiveIntegerField(default=0, editable=False)
+    # calendar bucket of validDate, for review by year, month and season without extracting dates row by row;
+    # set by save() (code that bulk-creates threads calls setCalendar itself)
+    validYear = models.PositiveSmallIntegerField(null=True, editable=False, db_index=True)
+    validMonth = models.PositiveSmallIntegerField(null=True, editable=False, db_index=True)
+    validSeason = models.CharField(max_length=6, choices=seasonChoices, blank=True, editable=False, db_index=True)
+
+    objects = ThreadQuerySet.as_manager()
+
+    class Meta:
+        # (steward, validDate) serves the steward branch of visible_to() together with a period filter
+        index_together = (('discussionCount', 'lastActivity'), ('steward', 'validDate'))
+
+    def save(self, *args, **kwargs):
+        self.setCalendar()
+        super(Thread, self).save(*args, **kwargs)
+
+    def setCalendar(self):
+        self.validYear, self.validMonth, self.validSeason = calendarBucket(self.validDate)
+
+    def updateSteward(self):
+        # recompute steward from the earliest remaining discussion (None if there are none)
+        first = self.discussions.order_by('pk').values_list('author', flat=True)[:1]
+        self.steward_id = first[0] if first else None
+        Thread.objects.filter(pk=self.pk).update(steward=self.steward_id)
+
+    def bumpVersion(self):
+        Thread.objects.filter(pk=self.pk).update(version=F('version') + 1)
+
+    def refreshActivity(self):
+        # recompute lastActivity, discussionCount and this thread's ThreadActivity rows from the discussions
+        discussions = list(self.discussions.values_list('createdDate', 'author'))
+        latestByAuthor = {}
+        for createdDate, author in discussions:
+            if author not in latestByAuthor or createdDate > latestByAuthor[author]:
+                latestByAuthor[author] = createdDate
+        self.discussionCount = len(discussions)
+        self.lastActivity = max(latestByAuthor.values()) if latestByAuthor else None
+        Thread.objects.filter(pk=self.pk).update(lastActivity=self.lastActivity, discussionCount=self.discussionCount)
+        ThreadActivity.objects.filter(thread=self).exclude(author__in=latestByAuthor.keys()).delete()
+        existing = dict(ThreadActivity.objects.filter(thread=self).values_list('author', 'lastActivity'))
+        for author, lastActivity in latestByAuthor.items():
+            if author not in existing:
+                ThreadActivity.objects.create(thread=self, author_id=author, lastActivity=lastActivity)
+            elif existing[author] != lastActivity:
+                ThreadActivity.objects.filter(thread=self, author=author).update(lastActivity=lastActivity)
 
     def __str__(self):
         return self.title + ' (' + self.validDate.strftime(dateFormatStr) + ')'
 
+class ThreadActivity(models.Model):
+    # when an author last wrote in a thread, so "threads I touched recently" is a range scan of one author's rows
+    author = models.ForeignKey('auth.User', related_name='threadActivity')
+    thread = models.ForeignKey(Thread, related_name='activity')
+    lastActivity = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('author', 'thread'),)
+        index_together = (('author', 'lastActivity'),)
+
+class EventQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        # an event is visible to its owner, and to everyone if it is public
+        if not user.is_authenticated():
+            return self.filter(isPublic=True)
+        return self.filter(Q(owner=user) | Q(isPublic=True))
+
+    def refreshThreadStats(self):
+        for event in self:
+            event.refreshThreadStats()
+
+    def spanning(self, start, end=None):
+        # events whose effective time range overlaps start..end (or contains start if end is not given);
+        # fixed and floating events alike, using the day buckets to avoid a scan of all events
+        if end is None:
+            end = start
+        bucketed = EventTimeBucket.objects.filter(day__gte=dayNumber(start), day__lte=dayNumber(end)).values('event')
+        return self.filter(pk__in=bucketed, effectiveStart__lte=end, effectiveEnd__gte=start)
+
 class Event(models.Model):
 # TODO summary and conclusion (isConcluded)
     title = models.CharField(max_length=120)
@@ -70,6 +215,18 @@ class Event(models.Model):
     threads = models.ManyToManyField(Thread, blank=True)
     isPublic = models.BooleanField(default=False, verbose_name='share this event with other users')
     isPermanent = models.BooleanField(default=False, verbose_name="keep this event forever")
+    # stored copy of the time range (fixed dates if the owner gave them, otherwise that of the threads)
+    # and number of threads, so event lists can be rendered without touching the threads;
+    # kept up to date by the receivers in signals.py, rebuild with 'manage.py rebuildeventstats'
+    effectiveStart = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+    effectiveEnd = models.DateTimeField(null=True, blank=True, editable=False)
+    threadCount = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        # public events are looked up by ThreadQuerySet.visible_to() for every thread list
+        index_together = (('isPublic', 'owner'),)
 
     def describeTimeRange(self):
         # start/end dates are preferred if user defined them
@@ -84,23 +241,122 @@ class Event(models.Model):
             else:
                 return unicode('undefined')
 
-    # optional arg 'doy' will cause returned start/end to be the day of year, not actual datetime
     def getThreadStats(self):
-	numThreads = len(self.threads.all())
+        return (self.effectiveStart,self.effectiveEnd,self.threadCount)
+
+    def refreshThreadStats(self):
+        # recompute the stored time range and thread count from the threads
+        dates = list(self.threads.order_by('validDate').values_list('validDate', flat=True))
+        self.threadCount = len(dates)
         if self.startDate and self.endDate:
-            return (self.startDate,self.endDate,numThreads)
-	if numThreads == 0:
-            return (None,None,0)
-        allThreadDates = [x.validDate for x in self.threads.all()]
-        allThreadDates.sort()
-        return(allThreadDates[0],allThreadDates[-1],numThreads)
+            self.effectiveStart, self.effectiveEnd = self.startDate, self.endDate
+        elif dates:
+            self.effectiveStart, self.effectiveEnd = dates[0], dates[-1]
+        else:
+            self.effectiveStart, self.effectiveEnd = None, None
+        Event.objects.filter(pk=self.pk).update(effectiveStart=self.effectiveStart, effectiveEnd=self.effectiveEnd, threadCount=self.threadCount)
+        self.refreshTimeBuckets()
+        self.refreshMonthBuckets()
+
+    def refreshTimeBuckets(self):
+        # make the day buckets match the effective time range, touching only the days that changed
+        if self.effectiveStart is None:
+            self.eventtimebucket_set.all().delete()
+            return
+        first, last = dayNumber(self.effectiveStart), dayNumber(self.effectiveEnd)
+        self.eventtimebucket_set.filter(Q(day__lt=first) | Q(day__gt=last)).delete()
+        existing = set(self.eventtimebucket_set.values_list('day', flat=True))
+        EventTimeBucket.objects.bulk_create([EventTimeBucket(event=self, day=d) for d in range(first, last + 1) if d not in existing])
+
+    def refreshMonthBuckets(self):
+        # same for the month buckets used by the review rollups
+        months = set(monthsSpanned(self.effectiveStart, self.effectiveEnd)) if self.effectiveStart is not None else set()
+        existing = dict(((year, month), pk) for (pk, year, month) in self.eventmonthbucket_set.values_list('pk', 'year', 'month'))
+        stale = [pk for (yearMonth, pk) in existing.items() if yearMonth not in months]
+        if stale:
+            EventMonthBucket.objects.filter(pk__in=stale).delete()
+        EventMonthBucket.objects.bulk_create([EventMonthBucket(event=self, year=year, month=month, season=seasonOf(month))
+            for (year, month) in sorted(months) if (year, month) not in existing])
 
     def __unicode__(self):
         return self.title + u' (' + self.describeTimeRange() + u')'
 
+class EventTimeBucket(models.Model):
+    # one row per UTC day touched by an event's effective time range, so that
+    # "which events span time T" is an indexed lookup rather than a scan of every event
+    event = models.ForeignKey(Event)
+    day = models.IntegerField()
+
+    class Meta:
+        unique_together = (('day', 'event'),)
+
+class EventMonthBucket(models.Model):
+    # one row per calendar month (UTC) touched by an event's effective time range, with its meteorological
+    # season, so events can be listed and counted by year, month or season from an index
+    event = models.ForeignKey(Event)
+    year = models.PositiveSmallIntegerField(db_index=True)
+    month = models.PositiveSmallIntegerField(db_index=True)
+    season = models.CharField(max_length=6, choices=seasonChoices, db_index=True)
+
+    class Meta:
+        unique_together = (('event', 'year', 'month'),)
+
+class EventUpdate(models.Model):
+    # a change to the threads of an event, kept briefly for pages following the event live (see live.py);
+    # the table is shared by all server processes, and its primary key orders the changes
+    event = models.ForeignKey(Event)
+    createdDate = models.DateTimeField(default=timezone.now, db_index=True)
+    kind = models.CharField(max_length=16)
+    data = models.TextField() # JSON
+
 class Tag(models.Model):
     name = models.CharField(max_length=64, primary_key=True)
     events = models.ManyToManyField(Event, blank=True)
+    # number of events with this tag, for scaling the tag cloud;
+    # kept up to date by the receivers in signals.py, rebuild with 'manage.py rebuildtagcounts'
+    eventCount = models.PositiveIntegerField(default=0, editable=False)
+
+    def refreshEventCount(self):
+        self.eventCount = self.events.count()
+        Tag.objects.filter(pk=self.pk).update(eventCount=self.eventCount)
 
     def __unicode__(self):
         return self.name
+
+class DataVersion(models.Model):
+    # single row, bumped whenever threads, events or their associations change (see signals.py),
+    # so responses computed from them can be validated with ETag/Last-Modified without recomputing them
+    version = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+def bumpDataVersion():
+    if not DataVersion.objects.filter(pk=1).update(version=F('version') + 1, modified=timezone.now()):
+        DataVersion.objects.get_or_create(pk=1)
+
+def currentDataVersion():
+    "(version, modified) of the data, in one query."
+    try:
+        return DataVersion.objects.values_list('version', 'modified').get(pk=1)
+    except DataVersion.DoesNotExist:
+        return (0, epoch)
+
+class ImportProgress(models.Model):
+    # number of records of an import source already committed by 'manage.py importevents',
+    # updated in the same transaction as each batch so an interrupted import can resume exactly
+    source = models.CharField(max_length=255, unique=True)
+    recordsDone = models.PositiveIntegerField(default=0)
+    updatedDate = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u'{0:s}: {1:d} records'.format(self.source, self.recordsDone)
+
+class ImportedId(models.Model):
+    # primary key given by 'manage.py importevents' to a thread or discussion of an import source, by the
+    # source's own id, so one shared by several events is created once, across batches and resumed runs
+    progress = models.ForeignKey(ImportProgress, related_name='importedIds')
+    model = models.CharField(max_length=16) # 'thread' or 'discussion'
+    sourceId = models.CharField(max_length=64)
+    targetId = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (('progress', 'model', 'sourceId'),)
@@ -0,0 +1,101 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.db.models import Count
+from .models import Event, EventMonthBucket, Thread, seasonChoices
+import calendar
+
+# Review of events and threads by calendar year, month and meteorological season, across all years.
+# Everything is read from the rollups kept by the models (EventMonthBucket rows, and the validYear,
+# validMonth and validSeason columns of Thread), so no query extracts dates from every row.
+
+reviewMaxItems = 500 # most events, and most threads, listed for one bucket (all are counted)
+
+# bucket kind -> (EventMonthBucket field, Thread field)
+bucketFields = {
+    'year': ('year', 'validYear'),
+    'month': ('month', 'validMonth'),
+    'season': ('season', 'validSeason'),
+}
+
+def parseBucket(query):
+    '''
+    Read the bucket selected by a query dict: one of 'year' (e.g. 2017), 'month' (1 to 12) or
+    'season' (winter, spring, summer or autumn). Returns (kind, value), (None, None) if no bucket
+    is selected, or raises ValueError if the value is not valid.
+    '''
+    for kind in ('year', 'month', 'season'):
+        value = query.get(kind)
+        if not value:
+            continue
+        if kind == 'season':
+            if value not in dict(seasonChoices):
+                raise ValueError(value)
+            return kind, value
+        value = int(value, 10)
+        if (kind == 'month' and not 1 <= value <= 12) or (kind == 'year' and not 1 <= value <= 9999):
+            raise ValueError(value)
+        return kind, value
+    return None, None
+
+def bucketName(kind, value):
+    if kind == 'month':
+        return calendar.month_name[value]
+    if kind == 'season':
+        return dict(seasonChoices)[value]
+    return unicode(value)
+
+def rollup(user):
+    '''
+    Numbers of events and threads visible to user per year, month and season: a dict mapping
+    'years', 'months' and 'seasons' to lists of {'value', 'name', 'events', 'threads'}.
+    An event counts in every month (and so season and year) its time range touches.
+    '''
+    buckets = EventMonthBucket.objects.filter(event__in=Event.objects.visible_to(user))
+    threads = Thread.objects.visible_to(user)
+    counts = {}
+    for kind, (eventField, threadField) in bucketFields.items():
+        eventCounts = dict(buckets.values_list(eventField).annotate(n=Count('event', distinct=True)).order_by())
+        threadCounts = dict(threads.values_list(threadField).annotate(n=Count('pk')).order_by())
+        counts[kind] = (eventCounts, threadCounts)
+    values = {
+        'year': sorted(set(counts['year'][0]) | set(counts['year'][1])),
+        'month': range(1, 13),
+        'season': [season for (season, name) in seasonChoices],
+    }
+    result = {}
+    for kind in ('year', 'month', 'season'):
+        eventCounts, threadCounts = counts[kind]
+        result[kind + 's'] = [{
+            'value': value,
+            'name': bucketName(kind, value),
+            'events': eventCounts.get(value, 0),
+            'threads': threadCounts.get(value, 0),
+        } for value in values[kind]]
+    return result
+
+def bucketEvents(user, kind, value):
+    "Events visible to user that touch the bucket, earliest first."
+    eventField = bucketFields[kind][0]
+    inBucket = EventMonthBucket.objects.filter(**{eventField: value}).values('event')
+    return Event.objects.visible_to(user).filter(pk__in=inBucket).order_by('effectiveStart', 'pk')
+
+def bucketThreads(user, kind, value):
+    "Threads visible to user that are valid in the bucket, earliest first."
+    threadField = bucketFields[kind][1]
+    return Thread.objects.visible_to(user).filter(**{threadField: value}).order_by('validDate', 'pk')
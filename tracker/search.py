@@ -0,0 +1,108 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.db import connection, connections
+from django.db.models import Q
+import re
+
+# Full-text search over thread titles and discussion text, backed by the FTS5 table
+# tracker_searchindex (one row per thread, created by migration 0012 and kept current by triggers).
+
+# snippet() wraps matched terms in these; the highlightSnippet filter turns them into markup after escaping
+snippetStart = u'\x02'
+snippetEnd = u'\x03'
+
+documentSql = '''
+    SELECT t.id, t.title, coalesce((SELECT group_concat(d.text, char(10))
+        FROM tracker_discussion d INNER JOIN tracker_thread_discussions td ON td.discussion_id = d.id
+        WHERE td.thread_id = t.id), '')
+    FROM tracker_thread t'''
+
+def threadDocumentSql(threadIdCondition):
+    # statements that replace the index rows of the threads matching threadIdCondition
+    return '''
+    DELETE FROM tracker_searchindex WHERE rowid {0};
+    INSERT INTO tracker_searchindex(rowid, title, body) {1} WHERE t.id {0};
+    '''.format(threadIdCondition, documentSql)
+
+# rebuild a thread's row whenever its title, its set of discussions, or one of those discussions' text changes,
+# so bulk inserts and admin edits are covered as well as the views
+triggers = [
+    ('tracker_searchindex_thread_ins', 'AFTER INSERT ON tracker_thread', threadDocumentSql('= new.id')),
+    ('tracker_searchindex_thread_upd', 'AFTER UPDATE OF title ON tracker_thread', threadDocumentSql('= new.id')),
+    ('tracker_searchindex_thread_del', 'AFTER DELETE ON tracker_thread', 'DELETE FROM tracker_searchindex WHERE rowid = old.id;'),
+    ('tracker_searchindex_link_ins', 'AFTER INSERT ON tracker_thread_discussions', threadDocumentSql('= new.thread_id')),
+    ('tracker_searchindex_link_del', 'AFTER DELETE ON tracker_thread_discussions', threadDocumentSql('= old.thread_id')),
+    ('tracker_searchindex_disco_upd', 'AFTER UPDATE OF text ON tracker_discussion',
+        threadDocumentSql('IN (SELECT thread_id FROM tracker_thread_discussions WHERE discussion_id = new.id)')),
+]
+
+def installTriggers(using=None, **kwargs):
+    '''
+    (Re)create the triggers that maintain tracker_searchindex. Connected to post_migrate:
+    when a migration remakes one of the tables, SQLite leaves the triggers pointing at the old copy.
+    '''
+    conn = connections[using] if using else connection
+    if conn.vendor != 'sqlite' or 'tracker_searchindex' not in conn.introspection.table_names():
+        return
+    cursor = conn.cursor()
+    for name, when, body in triggers:
+        cursor.execute('DROP TRIGGER IF EXISTS {0}'.format(name))
+        cursor.execute('CREATE TRIGGER {0} {1} BEGIN {2} END'.format(name, when, body))
+
+def ftsQuery(text):
+    "Turn user input into an FTS5 query: quoted strings are phrases, a trailing * asks for prefix matching."
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        if phrase.strip():
+            terms.append(u'"{0}"'.format(phrase.strip()))
+        elif word:
+            isPrefix = word.endswith('*')
+            word = word.replace('"', '').rstrip('*')
+            if word:
+                terms.append(u'"{0}"{1}'.format(word, '*' if isPrefix else ''))
+    return u' '.join(terms)
+
+def searchThreads(threads, text):
+    '''
+    Restrict a Thread queryset to threads matching text, best matches first.
+    Each returned thread has a searchSnippet attribute showing the matched terms in context.
+    '''
+    query = ftsQuery(text)
+    if not query:
+        return threads.none()
+    if connection.vendor != 'sqlite':
+        return threads.filter(Q(title__icontains=text) | Q(discussions__text__icontains=text)).distinct()
+    return threads.extra(
+        select={
+            'searchSnippet': "snippet(tracker_searchindex, -1, %s, %s, '...', 24)",
+            'searchRank': 'tracker_searchindex.rank',
+        },
+        select_params=[snippetStart, snippetEnd],
+        tables=['tracker_searchindex'],
+        where=['tracker_searchindex.rowid = tracker_thread.id', 'tracker_searchindex MATCH %s'],
+        params=[query],
+        order_by=['searchRank'])
+
+def rebuildIndex():
+    "Repopulate tracker_searchindex from scratch; returns the number of threads indexed."
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM tracker_searchindex')
+    cursor.execute('INSERT INTO tracker_searchindex(rowid, title, body) ' + documentSql)
+    cursor.execute('SELECT count(*) FROM tracker_searchindex')
+    return cursor.fetchone()[0]
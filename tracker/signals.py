@@ -0,0 +1,261 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.db.models.signals import m2m_changed, pre_delete, post_delete, pre_save, post_save
+from django.db.models import F
+from django.dispatch import receiver
+from .models import Discussion, Thread, Event, Tag, Pin, Chart, bumpDataVersion
+from . import dashboard, live
+
+
+@receiver(m2m_changed, sender=Thread.discussions.through)
+def discussionsChanged(sender, instance, action, reverse, pk_set, **kwargs):
+    # keep Thread.steward pointing at the author of the first discussion, keep the activity fields current,
+    # and invalidate rendered threads
+    if reverse:
+        # instance is a Discussion; pk_set holds thread pks
+        if action == 'pre_clear':
+            instance._stewardThreadPks = list(instance.thread_set.values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_stewardThreadPks', [])
+        elif action not in ('post_add', 'post_remove'):
+            return
+        for thread in Thread.objects.filter(pk__in=pk_set):
+            thread.updateSteward()
+            thread.refreshActivity()
+            thread.bumpVersion()
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        instance.updateSteward()
+        instance.refreshActivity()
+        instance.bumpVersion()
+
+@receiver(pre_delete, sender=Discussion)
+def discussionPreDelete(sender, instance, **kwargs):
+    # through rows are gone by post_delete, so note the affected threads now
+    instance._stewardThreadPks = list(instance.thread_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Discussion)
+def discussionPostDelete(sender, instance, **kwargs):
+    for thread in Thread.objects.filter(pk__in=getattr(instance, '_stewardThreadPks', [])):
+        thread.updateSteward()
+        thread.refreshActivity()
+        thread.bumpVersion()
+
+@receiver(post_save, sender=Discussion)
+def discussionSaved(sender, instance, created, **kwargs):
+    # text, date or author may have been edited (e.g. in the admin)
+    if not created:
+        Thread.objects.filter(discussions=instance).update(version=F('version') + 1)
+        for thread in Thread.objects.filter(discussions=instance):
+            thread.refreshActivity()
+
+@receiver(m2m_changed, sender=Event.threads.through)
+def eventThreadsChanged(sender, instance, action, reverse, pk_set, **kwargs):
+    # keep the stored time range and thread count of events up to date, and invalidate rendered threads
+    if reverse:
+        # instance is a Thread; pk_set holds event pks
+        if action == 'pre_clear':
+            instance._statsEventPks = list(instance.event_set.values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_statsEventPks', [])
+        elif action not in ('post_add', 'post_remove'):
+            return
+        Event.objects.filter(pk__in=pk_set).refreshThreadStats()
+        instance.bumpVersion()
+    else:
+        # instance is an Event; pk_set holds thread pks
+        if action == 'pre_clear':
+            instance._versionThreadPks = list(instance.threads.values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_versionThreadPks', [])
+        elif action not in ('post_add', 'post_remove'):
+            return
+        instance.refreshThreadStats()
+        Thread.objects.filter(pk__in=pk_set).update(version=F('version') + 1)
+
+@receiver(post_save, sender=Event)
+def eventSaved(sender, instance, **kwargs):
+    # fixed start/end dates may have been set or cleared
+    instance.refreshThreadStats()
+
+@receiver(post_save, sender=Thread)
+def threadSaved(sender, instance, created, **kwargs):
+    # valid date may have changed, which moves the range of floating events
+    if not created:
+        instance.event_set.all().refreshThreadStats()
+        instance.bumpVersion()
+
+@receiver(pre_delete, sender=Thread)
+def threadPreDelete(sender, instance, **kwargs):
+    instance._statsEventPks = list(instance.event_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Thread)
+def threadPostDelete(sender, instance, **kwargs):
+    Event.objects.filter(pk__in=getattr(instance, '_statsEventPks', [])).refreshThreadStats()
+
+@receiver(m2m_changed, sender=Tag.events.through)
+def tagEventsChanged(sender, instance, action, reverse, pk_set, **kwargs):
+    # keep Tag.eventCount up to date
+    if reverse:
+        # instance is an Event; pk_set holds tag names
+        if action == 'pre_clear':
+            instance._countTagNames = list(instance.tag_set.values_list('pk', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_countTagNames', [])
+        elif action not in ('post_add', 'post_remove'):
+            return
+        for tag in Tag.objects.filter(pk__in=pk_set):
+            tag.refreshEventCount()
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        instance.refreshEventCount()
+
+@receiver(pre_delete, sender=Event)
+def eventPreDelete(sender, instance, **kwargs):
+    instance._countTagNames = list(instance.tag_set.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=Event)
+def eventPostDelete(sender, instance, **kwargs):
+    for tag in Tag.objects.filter(pk__in=getattr(instance, '_countTagNames', [])):
+        tag.refreshEventCount()
+
+@receiver([post_save, post_delete], sender=Thread)
+@receiver([post_save, post_delete], sender=Event)
+@receiver(post_delete, sender=Discussion)
+@receiver(m2m_changed, sender=Event.threads.through)
+@receiver(m2m_changed, sender=Thread.discussions.through)
+def dataChanged(sender, **kwargs):
+    # thread or event data, visibility or associations may have changed (see DataVersion);
+    # deleting a discussion can change the steward of its threads, and so who sees them
+    if kwargs.get('action', 'post_').startswith('post_'):
+        bumpDataVersion()
+
+@receiver(m2m_changed, sender=Thread.discussions.through)
+def liveDiscussions(sender, instance, action, reverse, pk_set, **kwargs):
+    # tell pages following the thread's events about extensions
+    if reverse or action != 'post_add':
+        return
+    eventPks = list(instance.event_set.values_list('pk', flat=True))
+    if eventPks:
+        for discussion in Discussion.objects.filter(pk__in=pk_set).select_related('author').order_by('createdDate'):
+            live.publish(eventPks, 'discussion', live.discussionAdded(instance, discussion))
+
+@receiver(post_save, sender=Thread)
+def liveThreadSaved(sender, instance, created, **kwargs):
+    # frozen/unfrozen, or title or valid time changed
+    if not created:
+        live.publish(instance.event_set.values_list('pk', flat=True), 'thread', live.threadChanged(instance))
+
+@receiver(m2m_changed, sender=Event.threads.through)
+def liveAssociations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear':
+        # eventThreadsChanged noted what was there at pre_clear
+        pk_set = getattr(instance, '_statsEventPks' if reverse else '_versionThreadPks', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    added = action == 'post_add'
+    if reverse:
+        # instance is a Thread; pk_set holds event pks
+        live.publish(pk_set, 'association', live.threadAssociated(instance.pk, added))
+    else:
+        for threadPk in pk_set:
+            live.publish([instance.pk], 'association', live.threadAssociated(threadPk, added))
+
+@receiver([post_save, post_delete], sender=Pin)
+def dashboardPins(sender, instance, **kwargs):
+    dashboard.bump('pins:{0:d}'.format(instance.owner_id))
+
+@receiver(pre_save, sender=Event)
+def dashboardEventPreSave(sender, instance, **kwargs):
+    # an event made private must still leave everyone's timeline
+    instance._wasPublic = instance.pk is not None and Event.objects.filter(pk=instance.pk, isPublic=True).exists()
+
+@receiver(post_save, sender=Event)
+def dashboardEventSaved(sender, instance, **kwargs):
+    names = ['events:{0:d}'.format(instance.owner_id)]
+    if instance.isPublic or getattr(instance, '_wasPublic', False):
+        names.append('events:public')
+    dashboard.bump(*names)
+    dashboard.bumpForEvents(Event.objects.filter(pk=instance.pk))
+
+@receiver(post_delete, sender=Event)
+def dashboardEventDeleted(sender, instance, **kwargs):
+    # its pins are deleted (and announced) separately
+    dashboard.bump('events:public' if instance.isPublic else 'events:{0:d}'.format(instance.owner_id))
+    if getattr(instance, '_countTagNames', None):
+        dashboard.bump('tags')
+
+@receiver(m2m_changed, sender=Event.threads.through)
+def dashboardEventThreads(sender, instance, action, reverse, pk_set, **kwargs):
+    # the events' time ranges and thread counts change
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        eventPks = getattr(instance, '_statsEventPks', []) if action == 'post_clear' else pk_set
+        dashboard.bumpForEvents(Event.objects.filter(pk__in=eventPks))
+    else:
+        dashboard.bumpForEvents(Event.objects.filter(pk=instance.pk))
+
+@receiver(post_save, sender=Thread)
+def dashboardThreadSaved(sender, instance, created, **kwargs):
+    if not created:
+        dashboard.bumpForEvents(instance.event_set.all())
+        dashboard.bumpForThreads([instance.pk])
+
+@receiver(pre_delete, sender=Thread)
+def dashboardThreadPreDelete(sender, instance, **kwargs):
+    instance._dashboardAuthors = list(instance.discussions.values_list('author', flat=True).distinct())
+
+@receiver(post_delete, sender=Thread)
+def dashboardThreadDeleted(sender, instance, **kwargs):
+    dashboard.bumpForEvents(Event.objects.filter(pk__in=getattr(instance, '_statsEventPks', [])))
+    dashboard.bump(*['discussions:{0:d}'.format(a) for a in getattr(instance, '_dashboardAuthors', [])])
+
+@receiver(m2m_changed, sender=Thread.discussions.through)
+def dashboardThreadDiscussions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove') or reverse:
+        return
+    # everyone who has written in the thread sees its discussion count; the authors of removed discussions lose it
+    dashboard.bumpForThreads([instance.pk])
+    dashboard.bump(*['discussions:{0:d}'.format(a) for a in Discussion.objects.filter(pk__in=pk_set).values_list('author', flat=True)])
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver(m2m_changed, sender=Tag.events.through)
+def dashboardTags(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        dashboard.bump('tags')
+
+@receiver(pre_save, sender=Chart)
+def chartPreSave(sender, instance, raw=False, **kwargs):
+    # remember the stored image name, to tell an upload from an edit of the other fields
+    if raw or instance.pk is None:
+        return
+    instance._oldImage = Chart.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+@receiver(post_save, sender=Chart)
+def chartSaved(sender, instance, created, raw=False, **kwargs):
+    # a new or replaced image waits for 'manage.py buildchartderivatives', which hashes and resizes it
+    # outside the web server; until then derivativeUrl serves the original
+    if raw or not instance.image:
+        return
+    if created or instance.image.name != getattr(instance, '_oldImage', None):
+        Chart.objects.filter(pk=instance.pk).update(derivativesPending=True)
+        instance.derivativesPending = True
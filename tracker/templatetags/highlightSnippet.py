@@ -0,0 +1,11 @@
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from ..search import snippetStart, snippetEnd
+register = template.Library()
+
+def highlightSnippet(value):
+	# escape the snippet text, then turn the search markers into <mark> tags
+	return mark_safe(escape(value).replace(snippetStart, '<mark>').replace(snippetEnd, '</mark>'))
+
+register.filter('highlightSnippet',highlightSnippet)
@@ -16,6 +16,905 @@
     You should have received a copy of the GNU General Public License
     along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
 """
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models.signals import m2m_changed
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from tracker.benchmark.generate import Volumes, generate
+from tracker.benchmark.scenarios import scenarios, send
+from tracker import dashboard, live, views
+from tracker.models import Discussion, Event, EventMonthBucket, EventTimeBucket, EventUpdate, Pin, Tag, Thread, ThreadActivity, currentDataVersion
+from tracker.review import rollup
+from StringIO import StringIO
+import datetime
+import gzip
+import json
+import os
+import pytz
+import random
+import re
+import shutil
+import tempfile
+import unittest
 
-# Create your tests here.
+# Query plans of every benchmark scenario over a large seeded dataset. A plan step that reads a whole
+# table ("SCAN t" with no index) is a filter no index serves, which gets slower as the data grows,
+# so it fails the test; sorts in temporary b-trees over the rows already found are fine.
+
+planVolumes = Volumes(events=1000, looseThreads=500)
+requestsPerScenario = 5
+fullScan = re.compile(r'^SCAN (?:TABLE )?(?P<table>\w+)(?: AS (?P<alias>\w+))?$')
+
+# tables whose full scans are intended
+fullScanAllowed = {
+    'tracker_tag': 'the tag cloud and the tag choices of FindForm list every tag',
+    'tracker_eventupdate': 'live.latestUpdate reads the newest row, which is the last in rowid order',
+}
+
+def scannedTables(sql):
+    "Tables read in full by the plan of sql, as (table, plan step) pairs."
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+    scanned = []
+    for row in cursor.fetchall():
+        step = row[-1]
+        match = fullScan.match(step)
+        if not match:
+            continue
+        name = match.group('alias') or match.group('table')
+        # newer SQLite names only the alias; find the table it stands for
+        aliased = re.search(r'"(\w+)" {0:s}\b'.format(name), sql)
+        scanned.append((aliased.group(1) if aliased else name, step))
+    return scanned
+
+# the dashboard parts go to a throwaway cache, so the tests never read or clear the server's cache
+testCaches = dict(settings.CACHES, dashboard={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tests-dashboard',
+})
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is specific to SQLite')
+@override_settings(CACHES=testCaches)
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = generate(0, planVolumes)
+
+    def setUp(self):
+        # cached dashboard parts would hide the home page's queries
+        caches['dashboard'].clear()
+        self.user = self.dataset.users[0]
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def assertNoFullScans(self, name, scenario):
+        rng = random.Random(name)
+        problems = []
+        for i in range(requestsPerScenario):
+            method, url, data = scenario(rng, self.dataset, self.user)
+            with CaptureQueriesContext(connection) as queries:
+                response = send(self.client, method, url, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                for table, step in scannedTables(query['sql']):
+                    if table not in fullScanAllowed:
+                        problems.append('{0:s}: {1:s}\n    {2:s}'.format(url, step, query['sql']))
+        if problems:
+            self.fail('Full table scans in {0:s}:\n{1:s}'.format(name, '\n'.join(problems)))
+
+def scenarioTest(name, scenario):
+    def test(self):
+        self.assertNoFullScans(name, scenario)
+    test.__name__ = str('test_' + name)
+    return test
+
+for name, scenario in scenarios:
+    setattr(QueryPlanTests, 'test_' + name, scenarioTest(name, scenario))
+
+class ImportRoundTripTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        owner = User.objects.create_user('alice')
+        author = User.objects.create_user('bob')
+        self.shared = Thread.objects.create(title='shared', validDate=datetime.datetime(2017, 3, 1, 12, tzinfo=pytz.UTC))
+        for text in ('first', 'second'):
+            self.shared.discussions.add(Discussion.objects.create(author=author, text=text))
+        for title in ('one', 'two'):
+            Event.objects.create(title=title, owner=owner, isPublic=True).threads.add(self.shared)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def export(self):
+        "Export every event, then delete the events, threads and discussions; returns the exported lines."
+        path = os.path.join(self.directory, 'export.ndjson')
+        call_command('exportevents', output=path)
+        Event.objects.all().delete()
+        Thread.objects.all().delete()
+        Discussion.objects.all().delete()
+        with open(path) as f:
+            return f.readlines()
+
+    def importLines(self, lines, **options):
+        path = os.path.join(self.directory, 'import.ndjson')
+        with open(path, 'w') as f:
+            f.writelines(lines)
+        call_command('importevents', path, stdout=StringIO(), **options)
+
+    def assertSharedThreadOnce(self):
+        self.assertEqual(Event.objects.count(), 2)
+        self.assertEqual(Thread.objects.count(), 1)
+        self.assertEqual(Discussion.objects.count(), 2)
+        thread = Thread.objects.get()
+        self.assertEqual(sorted(thread.discussions.values_list('text', flat=True)), ['first', 'second'])
+        self.assertEqual(sorted(thread.event_set.values_list('title', flat=True)), ['one', 'two'])
+        self.assertEqual(thread.discussionCount, 2)
+        self.assertEqual(list(Event.objects.values_list('threadCount', flat=True)), [1, 1])
+
+    def test_sharedThreadAcrossBatches(self):
+        self.importLines(self.export(), batch_size=1)
+        self.assertSharedThreadOnce()
+
+    def test_sharedThreadAfterResume(self):
+        # the second run resumes after the first event, knowing the thread only from the saved ids
+        lines = self.export()
+        self.importLines(lines[:1])
+        self.importLines(lines)
+        self.assertSharedThreadOnce()
+
+# Behaviour of the stored copies and bulk paths. transaction.on_commit() callbacks never run inside
+# a TestCase, so live updates are checked through their rows.
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=pytz.UTC)
+
+def threadBy(user, title, validDate):
+    "A thread stewarded by user, with one discussion of theirs."
+    thread = Thread.objects.create(title=title, validDate=validDate)
+    thread.discussions.add(Discussion.objects.create(author=user, text=title))
+    return thread
+
+@override_settings(CACHES=testCaches)
+class AssociateTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.other = User.objects.create_user('bob')
+        self.early = threadBy(self.owner, 'early', utc(2017, 3, 1, 12))
+        self.late = threadBy(self.owner, 'late', utc(2017, 3, 5, 0))
+        self.event = Event.objects.create(title='floating', owner=self.owner)
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def associate(self, add=(), remove=()):
+        body = json.dumps({'add': [[t.pk, e.pk] for (t, e) in add], 'remove': [[t.pk, e.pk] for (t, e) in remove]})
+        return self.client.post(reverse('associate'), body, content_type='application/json')
+
+    def versions(self):
+        return dict(Thread.objects.values_list('title', 'version'))
+
+    def test_addAndRemove(self):
+        versions = self.versions()
+        dataVersion = currentDataVersion()[0]
+        response = self.associate(add=[(self.early, self.event), (self.late, self.event)])
+        self.assertEqual(json.loads(response.content), {'added': 2, 'removed': 0})
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual((event.threadCount, event.effectiveStart, event.effectiveEnd), (2, self.early.validDate, self.late.validDate))
+        self.assertEqual(EventTimeBucket.objects.filter(event=event).count(), 5)
+        self.assertEqual(self.versions(), dict((title, version + 1) for (title, version) in versions.items()))
+        self.assertGreater(currentDataVersion()[0], dataVersion)
+        response = self.associate(remove=[(self.early, self.event)])
+        self.assertEqual(json.loads(response.content), {'added': 0, 'removed': 1})
+        event = Event.objects.get(pk=self.event.pk)
+        self.assertEqual((event.threadCount, event.effectiveStart, event.effectiveEnd), (1, self.late.validDate, self.late.validDate))
+        self.assertEqual(EventTimeBucket.objects.filter(event=event).count(), 1)
+        self.assertEqual(self.versions(), {'early': versions['early'] + 2, 'late': versions['late'] + 1})
+
+    def test_unchangedPairsBumpNothing(self):
+        self.associate(add=[(self.early, self.event)])
+        versions = self.versions()
+        dataVersion = currentDataVersion()[0]
+        response = self.associate(add=[(self.early, self.event)], remove=[(self.late, self.event)])
+        self.assertEqual(json.loads(response.content), {'added': 0, 'removed': 0})
+        self.assertEqual(self.versions(), versions)
+        self.assertEqual(currentDataVersion()[0], dataVersion)
+
+    def test_sendsThreadsChanged(self):
+        # every m2m_changed receiver sees the bulk changes, as it would those of event.threads.add()/remove()
+        sent = []
+        def receiver(sender, instance, action, reverse, pk_set, **kwargs):
+            sent.append((instance.pk, action, reverse, sorted(pk_set)))
+        second = Event.objects.create(title='second', owner=self.owner)
+        m2m_changed.connect(receiver, sender=Event.threads.through)
+        try:
+            self.associate(add=[(self.early, self.event), (self.late, self.event), (self.late, second)])
+            self.associate(remove=[(self.early, self.event)])
+        finally:
+            m2m_changed.disconnect(receiver, sender=Event.threads.through)
+        both = sorted([self.early.pk, self.late.pk])
+        self.assertEqual(sent, [
+            (self.event.pk, 'pre_add', False, both), (second.pk, 'pre_add', False, [self.late.pk]),
+            (self.event.pk, 'post_add', False, both), (second.pk, 'post_add', False, [self.late.pk]),
+            (self.event.pk, 'pre_remove', False, [self.early.pk]), (self.event.pk, 'post_remove', False, [self.early.pk]),
+        ])
+
+    def test_refused(self):
+        othersThread = threadBy(self.other, 'theirs', utc(2017, 3, 2))
+        othersEvent = Event.objects.create(title='theirs', owner=self.other)
+        self.assertEqual(self.associate(add=[(self.early, self.event), (othersThread, self.event)]).status_code, 403)
+        self.assertEqual(self.associate(add=[(self.early, othersEvent)]).status_code, 403)
+        missing = Thread(pk=othersThread.pk + 100)
+        self.assertEqual(self.associate(add=[(missing, self.event)]).status_code, 404)
+        self.assertEqual(self.client.post(reverse('associate'), '{"add": 1}', content_type='application/json').status_code, 400)
+        # nothing was applied, not even the allowed pairs
+        self.assertFalse(Event.threads.through.objects.exists())
+        self.assertEqual(Event.objects.get(pk=self.event.pk).threadCount, 0)
+
+@override_settings(CACHES=testCaches)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.thread = threadBy(self.owner, 'thread', utc(2017, 3, 1, 12))
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def threadsForPeriod(self, **headers):
+        return self.client.get(reverse('threadsForPeriod'), {'from': '2017-03-01_00:00', 'to': '2017-03-02_00:00'}, **headers)
+
+    def test_notModifiedUntilWrite(self):
+        first = self.threadsForPeriod()
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        self.assertEqual(self.threadsForPeriod(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        threadBy(self.owner, 'another', utc(2017, 3, 1, 18))
+        second = self.threadsForPeriod(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(len(json.loads(second.content)), 2)
+
+    def test_discussionDeleted(self):
+        # the thread loses its steward, so the ETag must change
+        etag = self.threadsForPeriod()['ETag']
+        self.thread.discussions.get().delete()
+        self.assertEqual(self.threadsForPeriod(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_malformedTimes(self):
+        for (name, query) in (('threadsForPeriod', {'from': 'x', 'to': '2017-03-02_00:00'}),
+                ('threadsForPeriod', {'from': '2017-02-30_00:00', 'to': '2017-03-02_00:00'}),
+                ('threadsForPeriod', {}), ('eventsAtTime', {'when': 'x'}), ('eventsAtTime', {'when': '2017-02-30_00:00'})):
+            self.assertEqual(self.client.get(reverse(name), query).status_code, 400, query)
+
+@override_settings(CACHES=testCaches)
+class LiveUpdateTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.thread = threadBy(self.owner, 'thread', utc(2017, 3, 1))
+        self.event = Event.objects.create(title='event', owner=self.owner)
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def updates(self, after):
+        response = self.client.get(reverse('eventUpdates'), {'event': self.event.pk, 'after': after})
+        return json.loads(response.content)
+
+    def test_associationDelivered(self):
+        after = live.latestUpdate()
+        self.client.post(reverse('associate'), json.dumps({'add': [[self.thread.pk, self.event.pk]]}), content_type='application/json')
+        result = self.updates(after)
+        self.assertEqual([(kind, data) for (pk, kind, data) in result['updates']], [('association', {'thread': self.thread.pk, 'added': True})])
+        self.assertEqual(result['after'], result['updates'][-1][0])
+        self.client.post(reverse('associate'), json.dumps({'remove': [[self.thread.pk, self.event.pk]]}), content_type='application/json')
+        result = self.updates(result['after'])
+        self.assertEqual([(kind, data) for (pk, kind, data) in result['updates']], [('association', {'thread': self.thread.pk, 'added': False})])
+
+    def test_changeWhileRendering(self):
+        # an update published while the page reads the threads must come after the page's starting point
+        render = views.threadsForDisplay
+        def threadsForDisplay(threads, user):
+            live.publish([self.event.pk], 'thread', live.threadChanged(self.thread))
+            return render(threads, user)
+        views.threadsForDisplay = threadsForDisplay
+        try:
+            response = self.client.get(reverse('singleEvent', args=[self.event.pk]))
+        finally:
+            views.threadsForDisplay = render
+        result = self.updates(response.context['liveUpdatesAfter'])
+        self.assertEqual([kind for (pk, kind, data) in result['updates']], ['thread'])
+
+    def test_privateEventRefused(self):
+        User.objects.create_user('bob')
+        client = Client()
+        client.force_login(User.objects.get(username='bob'))
+        response = client.get(reverse('eventUpdates'), {'event': self.event.pk, 'after': 0})
+        self.assertEqual(response.status_code, 403)
+
+@override_settings(CACHES=testCaches)
+class PurgeExpiredTests(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('alice')
+        longAgo = datetime.datetime.now(pytz.UTC) - datetime.timedelta(days=800)
+        recently = datetime.datetime.now(pytz.UTC) - datetime.timedelta(days=10)
+        self.expired = Event.objects.create(title='expired', owner=owner)
+        self.expired.threads.add(threadBy(owner, 'only expired', longAgo), threadBy(owner, 'shared', longAgo))
+        self.permanent = Event.objects.create(title='permanent', owner=owner, isPermanent=True)
+        self.permanent.threads.add(Thread.objects.get(title='shared'), threadBy(owner, 'permanent', longAgo))
+        self.current = Event.objects.create(title='current', owner=owner)
+        self.current.threads.add(threadBy(owner, 'current', recently))
+        tag = Tag.objects.create(name='hail')
+        tag.events.add(self.expired, self.current)
+        Pin.objects.create(owner=owner, event=self.expired)
+        Pin.objects.create(owner=owner, event=self.current)
+
+    def test_dryRun(self):
+        out = StringIO()
+        call_command('purgeexpired', days=365, dry_run=True, stdout=out)
+        # the titles 'expired' and 'only expired', and the text of the one discussion that goes
+        self.assertIn('Would delete 1 events, 1 pins, 1 threads and 1 discussions', out.getvalue())
+        self.assertIn('(31 characters of text)', out.getvalue())
+        self.assertEqual(Event.objects.count(), 3)
+
+    def test_noOrphans(self):
+        self.assertTrue(EventUpdate.objects.filter(event=self.expired).exists())
+        call_command('purgeexpired', days=365, batch_size=1, stdout=StringIO())
+        self.assertEqual(sorted(Event.objects.values_list('title', flat=True)), ['current', 'permanent'])
+        self.assertEqual(sorted(Thread.objects.values_list('title', flat=True)), ['current', 'permanent', 'shared'])
+        self.assertEqual(sorted(Discussion.objects.values_list('text', flat=True)), ['current', 'permanent', 'shared'])
+        self.assertEqual(Tag.objects.get(name='hail').eventCount, 1)
+        events, threads, discussions = Event.objects.values('pk'), Thread.objects.values('pk'), Discussion.objects.values('pk')
+        for (model, field, remaining) in (
+                (Event.threads.through, 'event', events), (Event.threads.through, 'thread', threads),
+                (Thread.discussions.through, 'thread', threads), (Thread.discussions.through, 'discussion', discussions),
+                (Tag.events.through, 'event', events), (Pin, 'event', events), (EventUpdate, 'event', events),
+                (EventTimeBucket, 'event', events), (EventMonthBucket, 'event', events), (ThreadActivity, 'thread', threads)):
+            self.assertFalse(model.objects.exclude(**{field + '__in': remaining}).exists(), '{0:s}.{1:s}'.format(model.__name__, field))
+
+@override_settings(CACHES=testCaches)
+class FindTests(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('alice')
+        Event.objects.create(title='floating', owner=owner).threads.add(threadBy(owner, 'march', utc(2017, 3, 10, 18)))
+        Event.objects.create(title='fixed', owner=owner, startDate=utc(2017, 6, 30, 12), endDate=utc(2017, 7, 1, 12))
+        self.client = Client()
+        self.client.force_login(owner)
+
+    def find(self, **fields):
+        response = self.client.post(reverse('find'), fields)
+        return sorted(e.title for e in response.context['foundEvents'])
+
+    def test_byMonth(self):
+        self.assertEqual(self.find(months=['3']), ['floating'])
+        self.assertEqual(self.find(months=['7']), ['fixed'])
+        self.assertEqual(self.find(months=['3', '6']), ['fixed', 'floating'])
+        self.assertEqual(self.find(months=['99']), ['fixed', 'floating'])
+        self.assertEqual(self.find(months=['4']), [])
+
+    def test_byDates(self):
+        self.assertEqual(self.find(months=['99'], dateFrom='2017-03-10', dateTo='2017-03-10'), ['floating'])
+        self.assertEqual(self.find(months=['99'], dateFrom='2017-03-11'), ['fixed'])
+        self.assertEqual(self.find(months=['99'], dateTo='2017-06-30'), ['fixed', 'floating'])
+        self.assertEqual(self.find(months=['99'], dateTo='2017-03-09'), [])
+
+@override_settings(CACHES=testCaches)
+class ReviewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        other = User.objects.create_user('bob')
+        # Feb and Mar 2017: winter and spring
+        self.spanning = Event.objects.create(title='spanning', owner=self.user, startDate=utc(2017, 2, 20), endDate=utc(2017, 3, 5))
+        threadBy(self.user, 'mine', utc(2017, 3, 1))
+        Event.objects.create(title='public', owner=other, isPublic=True).threads.add(threadBy(other, 'shared', utc(2016, 12, 15)))
+        Event.objects.create(title='private', owner=other, startDate=utc(2018, 1, 1), endDate=utc(2018, 1, 2))
+        threadBy(other, 'hidden', utc(2018, 1, 1))
+
+    def counts(self, result, kind):
+        return dict((row['value'], (row['events'], row['threads'])) for row in result[kind] if row['events'] or row['threads'])
+
+    def test_rollup(self):
+        result = rollup(self.user)
+        self.assertEqual(self.counts(result, 'years'), {2016: (1, 1), 2017: (1, 1)})
+        self.assertEqual(self.counts(result, 'months'), {2: (1, 0), 3: (1, 1), 12: (1, 1)})
+        self.assertEqual(self.counts(result, 'seasons'), {'winter': (2, 1), 'spring': (1, 1)})
+        self.assertEqual(len(result['months']), 12)
+
+    def test_bucket(self):
+        client = Client()
+        client.force_login(self.user)
+        result = json.loads(client.get(reverse('reviewData'), {'season': 'winter'}).content)
+        self.assertEqual([title for (pk, title, start, end) in result['events']], ['public', 'spanning'])
+        self.assertEqual([title for (pk, title, validDate) in result['threads']], ['shared'])
+        self.assertEqual(client.get(reverse('reviewData'), {'month': '13'}).status_code, 400)
+
+    def test_page(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(reverse('review'), {'month': '3'})
+        self.assertContains(response, 'spanning')
+        self.assertNotContains(response, 'hidden')
+
+    def test_monthBuckets(self):
+        # those of a floating event follow its threads
+        first, last = threadBy(self.user, 'first', utc(2017, 3, 1)), threadBy(self.user, 'last', utc(2017, 5, 2))
+        event = Event.objects.create(title='floating', owner=self.user)
+        months = lambda: sorted(EventMonthBucket.objects.filter(event=event).values_list('year', 'month', 'season'))
+        event.threads.add(first, last)
+        self.assertEqual(months(), [(2017, 3, 'spring'), (2017, 4, 'spring'), (2017, 5, 'spring')])
+        event.threads.remove(first)
+        self.assertEqual(months(), [(2017, 5, 'spring')])
+        last.validDate = utc(2017, 12, 1)
+        last.save()
+        self.assertEqual(months(), [(2017, 12, 'winter')])
+        event.threads.clear()
+        self.assertEqual(months(), [])
+
+@override_settings(CACHES=testCaches)
+class DashboardTests(TransactionTestCase):
+    # not a TestCase: the generations are bumped in transaction.on_commit() callbacks
+
+    def setUp(self):
+        caches['dashboard'].clear()
+        self.owner = User.objects.create_user('alice')
+        self.viewer = User.objects.create_user('bob')
+        yesterday = datetime.datetime.now(pytz.UTC) - datetime.timedelta(days=1)
+        self.event = Event.objects.create(title='public', owner=self.owner, isPublic=True, startDate=yesterday, endDate=yesterday)
+
+    def home(self, user, part):
+        client = Client()
+        client.force_login(user)
+        return [str(item) for item in client.get(reverse('home')).context[part]]
+
+    def test_eventMadePrivate(self):
+        self.assertEqual(len(self.home(self.viewer, 'timelineEvents')), 1)
+        # a change that bumps nothing is not seen, so the part did come from the cache
+        Event.objects.filter(pk=self.event.pk).update(title='renamed')
+        self.assertEqual(len(self.home(self.viewer, 'timelineEvents')), 1)
+        self.event.isPublic = False
+        self.event.save()
+        self.assertEqual(self.home(self.viewer, 'timelineEvents'), [])
+        self.assertEqual(len(self.home(self.owner, 'timelineEvents')), 1)
+
+    def test_pinToggled(self):
+        client = Client()
+        client.force_login(self.owner)
+        self.assertEqual(self.home(self.owner, 'pinned'), [])
+        client.get(reverse('togglePin'), {'event': self.event.pk})
+        self.assertEqual(len(self.home(self.owner, 'pinned')), 1)
+        client.get(reverse('togglePin'), {'event': self.event.pk})
+        self.assertEqual(self.home(self.owner, 'pinned'), [])
+
+    def test_discussionAdded(self):
+        thread = threadBy(self.owner, 'thread', utc(2017, 3, 1))
+        self.assertEqual(self.home(self.viewer, 'recentThreads'), [])
+        thread.discussions.add(Discussion.objects.create(author=self.viewer, text='reply'))
+        self.assertEqual(self.home(self.viewer, 'recentThreads'), [str(thread)])
+
+    def test_evictedGeneration(self):
+        computed = []
+        def compute():
+            computed.append(None)
+            return len(computed)
+        self.assertEqual(dashboard.cachedPart('test', ['test'], compute), 1)
+        self.assertEqual(dashboard.cachedPart('test', ['test'], compute), 1)
+        # the part stored under the lost generation must not be read again
+        caches['dashboard'].delete('gen:test')
+        self.assertEqual(dashboard.cachedPart('test', ['test'], compute), 2)
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice', is_staff=True)
+        march, july = (utc(2017, 3, 1, 12), utc(2017, 3, 1, 18)), (utc(2017, 7, 1), utc(2017, 7, 2))
+        for (title, tags, (start, end)) in (('march', ['hail'], march), ('july', ['wind'], july), ('untagged', [], march)):
+            event = Event.objects.create(title=title, owner=self.owner, startDate=start, endDate=end)
+            for name in tags:
+                Tag.objects.get_or_create(name=name)[0].events.add(event)
+        floating = Event.objects.create(title='floating', owner=self.owner)
+        floating.threads.add(Thread.objects.create(title='thread', validDate=utc(2017, 3, 1, 15)))
+        for name in ('hail', 'wind'):
+            Tag.objects.get(name=name).events.add(floating)
+
+    def export(self, **options):
+        out = StringIO()
+        call_command('exportevents', stdout=out, **options)
+        return out.getvalue()
+
+    def titles(self, data):
+        return sorted(json.loads(line)['title'] for line in data.splitlines())
+
+    def test_filters(self):
+        self.assertEqual(self.titles(self.export()), ['floating', 'july', 'march', 'untagged'])
+        # events carrying any of the tags, as in find()
+        self.assertEqual(self.titles(self.export(tag=['hail'])), ['floating', 'march'])
+        self.assertEqual(self.titles(self.export(tag=['hail', 'wind'])), ['floating', 'july', 'march'])
+        period = {'timeFrom': '20170301_0000', 'timeTo': '20170302_0000'}
+        self.assertEqual(self.titles(self.export(**period)), ['floating', 'march', 'untagged'])
+        self.assertEqual(self.titles(self.export(tag=['wind'], **period)), ['floating'])
+
+    def test_gzip(self):
+        plain = self.export()
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(self.export(gzip=True))).read(), plain)
+        client = Client()
+        client.force_login(self.owner)
+        response = client.get(reverse('export'), {'tag': 'hail', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        data = gzip.GzipFile(fileobj=StringIO(b''.join(response.streaming_content))).read()
+        self.assertEqual(self.titles(data), ['floating', 'march'])
+
+@override_settings(CACHES=testCaches)
+class TimelineBinTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        for (hour, day) in ((1, 1), (5, 1), (23, 1), (12, 2)):
+            thread = Thread.objects.create(title='thread', validDate=utc(2017, 3, day, hour))
+            thread.discussions.add(Discussion.objects.create(author=self.user, text='text', createdDate=utc(2017, 3, day, hour)))
+        # not visible to alice
+        hidden = Thread.objects.create(title='hidden', validDate=utc(2017, 3, 1, 2))
+        hidden.discussions.add(Discussion.objects.create(author=User.objects.create_user('bob'), text='text', createdDate=utc(2017, 3, 1, 2)))
+        Event.objects.create(title='event', owner=self.user, startDate=utc(2017, 3, 1, 12), endDate=utc(2017, 3, 2, 12))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def bins(self, timeFrom, timeTo, binName):
+        response = self.client.get(reverse('timeline'), {'from': timeFrom, 'to': timeTo, 'bin': binName})
+        return [(b['start'][:16], b['threads'], b['discussions'], b['events']) for b in json.loads(response.content)['bins']]
+
+    def test_counts(self):
+        self.assertEqual(self.bins('2017-03-01_00:00', '2017-03-03_00:00', 'day'),
+            [('2017-03-01T00:00', 3, 3, 1), ('2017-03-02T00:00', 1, 1, 1)])
+        self.assertEqual(self.bins('2017-03-01_00:00', '2017-03-01_18:00', '6h'),
+            [('2017-03-01T00:00', 2, 2, 0), ('2017-03-01T06:00', 0, 0, 0), ('2017-03-01T12:00', 0, 0, 1)])
+
+    def test_binnedInPython(self):
+        # the binning used on databases other than SQLite gives the same counts
+        threads = Thread.objects.visible_to(self.user)
+        counts = views.binnedCounts(threads, 'validDate', 6 * 3600)
+        connection.vendor = 'other'
+        try:
+            self.assertEqual(views.binnedCounts(threads, 'validDate', 6 * 3600), counts)
+        finally:
+            del connection.vendor
+        self.assertEqual(sorted(counts.values()), [1, 1, 2])
+
+    def test_invalid(self):
+        for query in ({'from': '2017-02-30_00:00', 'to': '2017-03-02_00:00'}, {'from': '2017-03-01_00:00', 'to': '2017-03-02_00:00', 'bin': 'week'},
+                {'from': '2017-03-02_00:00', 'to': '2017-03-01_00:00'}):
+            self.assertEqual(self.client.get(reverse('timeline'), query).status_code, 400, query)
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'the search index is an SQLite FTS5 table')
+@override_settings(CACHES=testCaches)
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.other = User.objects.create_user('bob')
+        snow = threadBy(self.owner, 'Lake effect snow', utc(2017, 1, 5))
+        snow.discussions.add(Discussion.objects.create(author=self.owner, text='Heavy lake effect bands expected downwind <b>tonight</b>'))
+        threadBy(self.owner, 'Supercell outbreak', utc(2017, 5, 20)).discussions.add(
+            Discussion.objects.create(author=self.owner, text='Tornadic supercells likely'))
+        threadBy(self.other, 'Lake breeze', utc(2017, 6, 1))
+
+    def find(self, text, user=None):
+        client = Client()
+        client.force_login(user or self.owner)
+        response = client.post(reverse('find'), {'textSearch': text, 'months': ['99']})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def titles(self, text, user=None):
+        return sorted(thread.title for thread in self.find(text, user).context['foundThreads'])
+
+    def test_phrase(self):
+        self.assertEqual(self.titles('"lake effect"'), ['Lake effect snow'])
+        self.assertEqual(self.titles('"effect lake"'), [])
+        # separate words must all be there, in any order
+        self.assertEqual(self.titles('bands lake'), ['Lake effect snow'])
+
+    def test_prefix(self):
+        self.assertEqual(self.titles('downw*'), ['Lake effect snow'])
+        self.assertEqual(self.titles('downw'), [])
+        self.assertEqual(self.titles('super* lik*'), ['Supercell outbreak'])
+
+    def test_hostileInput(self):
+        # FTS5 syntax in the input is searched for as text, never parsed
+        for text in ('foo"bar', 'NEAR(', '-x', 'lake AND', 'OR', '"', '*', ')(', 'title:lake'):
+            self.titles(text)
+        self.assertEqual(self.titles('lake OR supercell'), [])
+
+    def test_visibility(self):
+        self.assertEqual(self.titles('lake'), ['Lake effect snow'])
+        self.assertEqual(self.titles('lake', self.other), ['Lake breeze'])
+
+    def test_snippet(self):
+        response = self.find('downwind')
+        self.assertIn(u'\x02downwind\x03', response.context['foundThreads'][0].searchSnippet)
+        # the matched term is marked, and the discussion text escaped
+        self.assertContains(response, '<mark>downwind</mark> &lt;b&gt;tonight&lt;/b&gt;')
+
+@override_settings(CACHES=testCaches)
+class StewardTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.other = User.objects.create_user('bob')
+        self.thread = threadBy(self.owner, 'thread', utc(2017, 3, 1))
+        self.first = self.thread.discussions.get()
+        self.thread.discussions.add(Discussion.objects.create(author=self.other, text='reply'))
+
+    def steward(self):
+        return Thread.objects.get(pk=self.thread.pk).steward
+
+    def test_firstRemoved(self):
+        self.assertEqual(self.steward(), self.owner)
+        self.thread.discussions.remove(self.first)
+        self.assertEqual(self.steward(), self.other)
+        # and with it who may see the (private) thread
+        self.assertFalse(Thread.objects.visible_to(self.owner).exists())
+        self.assertTrue(Thread.objects.visible_to(self.other).exists())
+        self.thread.discussions.add(self.first)
+        self.assertEqual(self.steward(), self.owner)
+
+    def test_firstDeleted(self):
+        self.first.delete()
+        self.assertEqual(self.steward(), self.other)
+        Discussion.objects.all().delete()
+        self.assertIsNone(self.steward())
+
+    def test_removedFromDiscussionSide(self):
+        self.first.thread_set.clear()
+        self.assertEqual(self.steward(), self.other)
+
+@override_settings(CACHES=testCaches)
+class EventStatsTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.early = threadBy(self.owner, 'early', utc(2017, 3, 1, 12))
+        self.late = threadBy(self.owner, 'late', utc(2017, 3, 4, 0))
+        self.event = Event.objects.create(title='floating', owner=self.owner)
+
+    def stats(self):
+        return Event.objects.get(pk=self.event.pk).getThreadStats()
+
+    def test_floating(self):
+        self.assertEqual(self.stats(), (None, None, 0))
+        self.event.threads.add(self.early, self.late)
+        self.assertEqual(self.stats(), (self.early.validDate, self.late.validDate, 2))
+        self.event.threads.remove(self.early)
+        self.assertEqual(self.stats(), (self.late.validDate, self.late.validDate, 1))
+        other = Event.objects.create(title='other', owner=self.owner)
+        self.late.event_set.add(other)
+        self.event.threads.clear()
+        self.assertEqual(self.stats(), (None, None, 0))
+        self.assertEqual(Event.objects.get(pk=other.pk).threadCount, 1)
+
+    def test_threadChanges(self):
+        self.event.threads.add(self.early, self.late)
+        self.late.validDate = utc(2017, 3, 10)
+        self.late.save()
+        self.assertEqual(self.stats(), (self.early.validDate, utc(2017, 3, 10), 2))
+        self.early.delete()
+        self.assertEqual(self.stats(), (utc(2017, 3, 10), utc(2017, 3, 10), 1))
+
+    def test_fixedDates(self):
+        self.event.threads.add(self.early)
+        self.event.startDate, self.event.endDate = utc(2017, 2, 1), utc(2017, 2, 2)
+        self.event.save()
+        self.assertEqual(self.stats(), (utc(2017, 2, 1), utc(2017, 2, 2), 1))
+        self.event.startDate = self.event.endDate = None
+        self.event.save()
+        self.assertEqual(self.stats(), (self.early.validDate, self.early.validDate, 1))
+
+@override_settings(CACHES=testCaches)
+class EventTimeBucketTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.first = threadBy(self.owner, 'first', utc(2017, 3, 1, 6))
+        self.last = threadBy(self.owner, 'last', utc(2017, 3, 3, 18))
+        self.event = Event.objects.create(title='floating', owner=self.owner)
+        self.event.threads.add(self.first, self.last)
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def days(self):
+        return EventTimeBucket.objects.filter(event=self.event).count()
+
+    def eventsAt(self, when):
+        return [title for (title, owner, associated) in json.loads(self.client.get(reverse('eventsAtTime'), {'when': when}).content).values()]
+
+    def test_floatingEvent(self):
+        self.assertEqual(self.days(), 3)
+        self.assertEqual(self.eventsAt('2017-03-02_12:00'), ['floating'])
+        self.assertEqual(self.eventsAt('2017-03-01_05:00'), [])
+        self.event.threads.remove(self.last)
+        self.assertEqual(self.days(), 1)
+        self.assertEqual(self.eventsAt('2017-03-02_12:00'), [])
+        self.assertEqual(self.eventsAt('2017-03-01_06:00'), ['floating'])
+
+@override_settings(CACHES=testCaches)
+class TagCountTests(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('alice')
+        self.events = [Event.objects.create(title=title, owner=owner) for title in ('one', 'two', 'three')]
+        self.tag = Tag.objects.create(name='hail')
+        self.tag.events.add(*self.events)
+
+    def count(self):
+        return Tag.objects.get(pk=self.tag.pk).eventCount
+
+    def test_addAndRemove(self):
+        self.assertEqual(self.count(), 3)
+        self.tag.events.remove(self.events[0])
+        self.assertEqual(self.count(), 2)
+        self.events[0].tag_set.add(self.tag)
+        self.events[1].tag_set.remove(self.tag)
+        self.assertEqual(self.count(), 2)
+
+    def test_clear(self):
+        self.events[0].tag_set.clear()
+        self.assertEqual(self.count(), 2)
+        self.tag.events.clear()
+        self.assertEqual(self.count(), 0)
+
+    def test_eventDeleted(self):
+        self.events[0].delete()
+        self.assertEqual(self.count(), 2)
+        Event.objects.filter(pk=self.events[1].pk).delete()
+        self.assertEqual(self.count(), 1)
+
+@override_settings(CACHES=testCaches)
+class SingleEventQueryTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.other = User.objects.create_user('bob')
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def eventWith(self, numThreads):
+        event = Event.objects.create(title='{0:d} threads'.format(numThreads), owner=self.owner, isPublic=True)
+        for i in range(numThreads):
+            thread = threadBy(self.owner if i % 2 else self.other, 'thread', utc(2017, 3, 1 + i))
+            thread.discussions.add(*[Discussion.objects.create(author=self.other, text='reply') for j in range(i)])
+            event.threads.add(thread)
+        Tag.objects.get_or_create(name='hail')[0].events.add(event)
+        return event
+
+    def queries(self, event):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(reverse('singleEvent', args=[event.pk])).status_code, 200)
+        return len(context)
+
+    def test_constantQueries(self):
+        small, large = self.eventWith(1), self.eventWith(6)
+        # rendered from the database, then with the thread bodies cached
+        caches['default'].clear()
+        self.assertEqual(self.queries(small), self.queries(large))
+        self.assertEqual(self.queries(small), self.queries(large))
+
+@override_settings(CACHES=testCaches)
+class ThreadBodyCacheTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.owner = User.objects.create_user('alice')
+        self.thread = Thread.objects.create(title='thread', validDate=utc(2017, 3, 1))
+        self.thread.discussions.add(Discussion.objects.create(author=self.owner, text='original text'))
+        self.client = Client()
+        self.client.force_login(self.owner)
+
+    def page(self):
+        return self.client.get(reverse('singleThread', args=[self.thread.pk]))
+
+    def test_discussionEdited(self):
+        self.assertContains(self.page(), 'original text')
+        discussion = self.thread.discussions.get()
+        # a change that bumps no version is not seen, so the body did come from the cache
+        Discussion.objects.filter(pk=discussion.pk).update(text='changed quietly')
+        self.assertContains(self.page(), 'original text')
+        discussion.text = 'edited text'
+        discussion.save()
+        response = self.page()
+        self.assertContains(response, 'edited text')
+        self.assertNotContains(response, 'original text')
+
+    def test_discussionAddedAndRemoved(self):
+        self.page()
+        reply = Discussion.objects.create(author=self.owner, text='a reply')
+        self.thread.discussions.add(reply)
+        self.assertContains(self.page(), 'a reply')
+        self.thread.discussions.remove(reply)
+        self.assertNotContains(self.page(), 'a reply')
+
+@override_settings(CACHES=testCaches)
+class TimelinePagingTests(TestCase):
+
+    def setUp(self):
+        caches['dashboard'].clear()
+        owner = User.objects.create_user('alice')
+        now = datetime.datetime.now(pytz.UTC)
+        # e00 is the newest past event; e24 and e25 start together, on either side of the first page's end
+        for i in range(30):
+            start = now - datetime.timedelta(days=min(i, 24) + 1)
+            Event.objects.create(title='e{0:02d}'.format(i), owner=owner, startDate=start, endDate=start)
+        for i in range(2):
+            start = now + views.timelineLookahead + datetime.timedelta(days=i + 1)
+            Event.objects.create(title='future{0:d}'.format(i), owner=owner, startDate=start, endDate=start)
+        self.client = Client()
+        self.client.force_login(owner)
+
+    def page(self, **cursor):
+        result = json.loads(self.client.get(reverse('timelineEvents'), cursor).content)
+        return ([title for (pk, title, timeRange) in result['events']], result['older'], result['newer'])
+
+    def test_olderThenNewer(self):
+        context = self.client.get(reverse('home')).context
+        first = [e.title for e in context['timelineEvents']]
+        self.assertEqual(len(first), views.timelinePageSize)
+        self.assertEqual(first[0], 'e00')
+        (older, olderCursor, newerCursor) = self.page(older=context['timelineOlder'])
+        self.assertEqual(sorted(first + older), sorted('e{0:02d}'.format(i) for i in range(30)))
+        self.assertIsNone(olderCursor)
+        # back again: the first page exactly, then the events beyond it
+        (newer, olderCursor, newerCursor) = self.page(newer=newerCursor)
+        self.assertEqual(newer, first)
+        self.assertIsNotNone(olderCursor)
+        (future, olderCursor, newerCursor) = self.page(newer=newerCursor)
+        self.assertEqual((future, newerCursor), (['future1', 'future0'], None))
+        self.assertIsNotNone(context['timelineNewer'])
+
+@override_settings(CACHES=testCaches)
+class ThreadActivityTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('alice')
+        self.other = User.objects.create_user('bob')
+        self.thread = Thread.objects.create(title='thread', validDate=utc(2017, 3, 1))
+        self.discussions = [Discussion.objects.create(author=author, text='text', createdDate=utc(2017, 3, 1, hour))
+            for (author, hour) in ((self.owner, 1), (self.other, 2), (self.owner, 3))]
+        self.thread.discussions.add(*self.discussions)
+
+    def activity(self):
+        thread = Thread.objects.get(pk=self.thread.pk)
+        return (thread.lastActivity, thread.discussionCount,
+            sorted((a.author.username, a.lastActivity) for a in ThreadActivity.objects.filter(thread=thread)))
+
+    def test_added(self):
+        self.assertEqual(self.activity(), (utc(2017, 3, 1, 3), 3, [('alice', utc(2017, 3, 1, 3)), ('bob', utc(2017, 3, 1, 2))]))
+
+    def test_deleted(self):
+        self.discussions[2].delete()
+        self.assertEqual(self.activity(), (utc(2017, 3, 1, 2), 2, [('alice', utc(2017, 3, 1, 1)), ('bob', utc(2017, 3, 1, 2))]))
+        self.discussions[1].delete()
+        self.assertEqual(self.activity(), (utc(2017, 3, 1, 1), 1, [('alice', utc(2017, 3, 1, 1))]))
+        self.discussions[0].delete()
+        self.assertEqual(self.activity(), (None, 0, []))
+
+    def test_removedAndEdited(self):
+        self.thread.discussions.remove(self.discussions[1])
+        self.assertEqual(self.activity(), (utc(2017, 3, 1, 3), 2, [('alice', utc(2017, 3, 1, 3))]))
+        self.discussions[0].createdDate = utc(2017, 3, 1, 4)
+        self.discussions[0].save()
+        self.assertEqual(self.activity(), (utc(2017, 3, 1, 4), 2, [('alice', utc(2017, 3, 1, 4))]))
+        self.thread.discussions.clear()
+        self.assertEqual(self.activity(), (None, 0, []))
+
+    def test_threadDeleted(self):
+        self.thread.delete()
+        self.assertFalse(ThreadActivity.objects.exists())
@@ -40,10 +40,18 @@ urlpatterns = [
     url(r'changeThread/(?P<pk>\d+)$', ChangeThread.as_view(), name='changeThread'),
     url(r'tag/([^,\\\']+)$', views.singleTag, name='singleTag'),
     url(r'find/$', views.find, name='find'),
+    url(r'review/$', views.review, name='review'),
+    url(r'export/$', views.export, name='export'),
+    url(r'stats/views$', views.viewStats, name='viewStats'),
     url(r'async/togglePin$', views.asyncTogglePin, name='togglePin'),
     url(r'async/toggleTag$', views.asyncToggleTag, name='toggleTag'),
     url(r'async/toggleFrozen$', views.asyncToggleFrozen, name='toggleFrozen'),
     url(r'async/threadsForPeriod$', views.asyncThreadsForPeriod, name='threadsForPeriod'),
     url(r'async/eventsAtTime$', views.asyncEventsAtTime, name='eventsAtTime'),
+    url(r'async/timelineEvents$', views.asyncTimelineEvents, name='timelineEvents'),
+    url(r'async/timeline$', views.asyncTimeline, name='timeline'),
+    url(r'async/review$', views.asyncReview, name='reviewData'),
     url(r'async/associateEventsWithThread$', views.asyncAssociateEventsWithThread, name='associateEventsWithThread'),
+    url(r'async/associate$', views.asyncAssociate, name='associate'),
+    url(r'async/eventUpdates$', views.asyncEventUpdates, name='eventUpdates'),
 ]
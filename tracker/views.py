@@ -17,38 +17,60 @@
     along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
 """
 from django.shortcuts import render
-from django.db.models import Q, Count, Max, Min
-from django.http import HttpResponseRedirect, HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotFound, HttpResponseForbidden, Http404
+from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q, Count, Max
+from django.db.models.signals import m2m_changed
+from django.http import HttpResponseRedirect, HttpResponse, StreamingHttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotFound, HttpResponseForbidden, Http404
 from django.contrib.auth.decorators import login_required
 from django.views.generic.edit import UpdateView
+from django.views.decorators.http import condition
 from django.core.urlresolvers import reverse
-from .models import Discussion, Event, Pin, Thread, Tag
+from .models import Discussion, Event, EventMonthBucket, Pin, Thread, ThreadActivity, Tag, currentDataVersion
+from .search import searchThreads
+from .export import exportEvents, exportRecords, ndjsonLines, gzipChunks
+from .review import reviewMaxItems, parseBucket, bucketName, rollup, bucketEvents, bucketThreads
+from . import live, viewstats
+from .dashboard import cachedPart
 from .forms import ThreadForm, DiscussionFormTextOnly, EventForm, ChangeEventForm, ChangeThreadForm, FindForm
+from functools import wraps
 from itertools import chain
+from collections import defaultdict
 import datetime
+import hashlib
+import json
+import os
 import pytz
 import re
 
+threadBodyTimeout = 7 * 24 * 3600 # seconds a rendered thread body stays cached
+timelinePageSize = 25
+timelineLookahead = datetime.timedelta(days=7) # first page of the timeline starts this far after now
+activityBinSizes = {'hour': 3600, '6h': 6 * 3600, 'day': 24 * 3600} # seconds
+activityMaxBins = 5000
+activityMaxThreads = 500 # most threads listed individually by async/timeline (all are counted)
+liveUpdateTimeout = 25 # seconds a long-poll for event updates waits before answering with nothing
+timelineCursorPattern = re.compile(r'^(\d{4})(\d\d)(\d\d)(\d\d)(\d\d)(\d\d)(\d{6})_(\d+)$')
 
 @login_required
 def home(request):
-    timelineEvents = Event.objects.filter(Q(owner=request.user) | Q(isPublic=True))
-    pinned = Pin.objects.filter(owner=request.user)
-    recentDate = datetime.datetime.now().replace(tzinfo=pytz.UTC) - datetime.timedelta(days=3)
-    # recentThreads is any thread with a discussion written by this user, and that was created since recentDate
-    recentThreads = Thread.objects.filter(discussions__author=request.user, discussions__createdDate__gte=recentDate).annotate(lastEdit=Max('discussions__createdDate')).order_by('-lastEdit')
-    tags = Tag.objects.all().annotate(numEvents=Count('events'))
-    tagScale = tags.aggregate(Max('numEvents'))['numEvents__max'] # number of events in most popular tag
-    tagDisplaySizes = {}
-    # scale tags based on popularity
-    for tag in tags:
-        frac = tag.events.count() / float(tagScale)
-        tagDisplaySizes[tag.name] = int(frac * 5)
+    # the parts of the page are cached per user and invalidated by signals (see dashboard.py)
+    userPk = request.user.pk
+    (timelineEvents, timelineOlder, timelineNewer) = cachedPart('timeline', ['events:public', 'events:{0:d}'.format(userPk)],
+        lambda: timelinePage(request.user))
+    pinned = cachedPart('pinned', ['pins:{0:d}'.format(userPk)],
+        lambda: list(Pin.objects.filter(owner=request.user).select_related('event')))
+    recentThreads = cachedPart('recentThreads', ['discussions:{0:d}'.format(userPk)],
+        lambda: recentThreadsFor(request.user))
+    (tags, tagDisplaySizes) = cachedPart('tags', ['tags'], tagCloud)
     return render(request, 'tracker/home.html', { \
         'timelineEvents': timelineEvents, \
+        'timelineOlder': timelineOlder, \
+        'timelineNewer': timelineNewer, \
         'pinned': pinned, \
         'recentThreads': recentThreads, \
-        'findForm': FindForm(), \
+        'findForm': FindForm(tagNames=[tag.name for tag in tags]), \
         'newThread': ThreadForm(eventChoices=[x.event for x in pinned], selectedChoice=None), \
         'newEvent': EventForm(), \
         'tags': tags, \
@@ -56,6 +78,27 @@ def home(request):
         'presetDatetimes': getDatetimePresets()
     })
 
+def recentThreadsFor(user):
+    recentDate = datetime.datetime.now().replace(tzinfo=pytz.UTC) - datetime.timedelta(days=3)
+    # recentThreads is any thread with a discussion written by this user since recentDate, latest first;
+    # read from the (author, lastActivity) index of ThreadActivity
+    threads = []
+    for activity in ThreadActivity.objects.filter(author=user, lastActivity__gte=recentDate).order_by('-lastActivity').select_related('thread'):
+        activity.thread.lastEdit = activity.lastActivity
+        threads.append(activity.thread)
+    return threads
+
+def tagCloud():
+    "All tags, and the display size of each (0-5, scaled by popularity)."
+    tags = list(Tag.objects.all())
+    tagScale = max([tag.eventCount for tag in tags] or [0]) # number of events in most popular tag
+    tagDisplaySizes = {}
+    # scale tags based on popularity
+    for tag in tags:
+        frac = tag.eventCount / float(tagScale) if tagScale else 0
+        tagDisplaySizes[tag.name] = int(frac * 5)
+    return (tags, tagDisplaySizes)
+
 @login_required
 def newThread(request, setEvent=None):
     formAction = ''
@@ -77,10 +120,9 @@ def newThread(request, setEvent=None):
             # make discussion object, then add it to a new thread object
             discoObj = Discussion(author=request.user, text=_text)
             discoObj.save()
-            threadObj = Thread(title=_title, validDate=_valid, isExtensible=_isExtensible)
+            threadObj = Thread(title=_title, validDate=_valid, isExtensible=_isExtensible, steward=request.user)
             threadObj.save()
             threadObj.discussions.add(discoObj)
-            threadObj.save()
             _eventIds = newThread.cleaned_data['_event']
             for e in _eventIds:
                 Event.objects.get(id=e).threads.add(threadObj)
@@ -96,8 +138,8 @@ def newThread(request, setEvent=None):
             formAction = reverse('newThread')
         else:
             # specified event must be public, or owned by user, in order to continue
-            eventsRequested = Event.objects.filter(id=setEvent)
-            if eventsRequested[0].owner == request.user or eventsRequested[0].isPublic:
+            eventsRequested = Event.objects.visible_to(request.user).filter(id=setEvent)
+            if eventsRequested.exists():
                 newThread = ThreadForm(eventChoices=eventsRequested, selectedChoice=setEvent)
                 formAction = reverse('newThreadInEvent', args=[setEvent])
             else:
@@ -110,56 +152,52 @@ def newThread(request, setEvent=None):
     })
 
 def find(request):
-    "Find events matching given tag and/or threads containing given string. Addditionally they can be constrained to given months of the year."
+    "Find events matching given tag and/or threads containing given string. Addditionally they can be constrained to given months of the year, and to a range of dates."
     totalQ = Q()
     if request.method == 'POST':
         findForm = FindForm(request.POST)
         if not findForm.is_valid():
             return # TEST
-        # make a Q object to represent the month constraint
+        # make Q objects to represent the month and date constraints
         # different objects for Event and Thread due to differing field names
-        # initialize to an impossible month so filters return nothing
-        eventMonthQ = Q(startDate__month=13)
-        threadMonthQ = Q(validDate__month=13)
-        try:
-            for month in findForm.cleaned_data.get('months'):
-                # 99 specified in form as 'all months', so ignore all other month settings
-                if month == '99':
-                    eventMonthQ = Q()
-                    threadMonthQ = Q()
-                    break
-                eventMonthQ |= Q(startDate__month=month) | Q(endDate__month=month)
-                threadMonthQ |= Q(validDate__month=month)
-        except KeyError:
-            pass # leave eventMonthQ empty
-        except:
-            Http404('Error processing month selection')
-        # TODO could also filter based on month of component threads, to capture floating events
+        # events are matched on their stored effective time range (fixed dates, or those of their threads),
+        # through the month buckets for months, so floating events are found in the same single query
+        # no months selected means no results, as the filters then match nothing
+        eventMonthQ = Q()
+        threadMonthQ = Q()
+        months = findForm.cleaned_data.get('months') or []
+        # 99 specified in form as 'all months', so ignore all other month settings
+        if '99' not in months:
+            months = [int(m) for m in months]
+            eventMonthQ = Q(pk__in=EventMonthBucket.objects.filter(month__in=months).values('event'))
+            threadMonthQ = Q(validMonth__in=months)
+        dateFrom, dateTo = findForm.cleaned_data.get('dateFrom'), findForm.cleaned_data.get('dateTo')
+        if dateFrom:
+            timeFrom = datetime.datetime(dateFrom.year, dateFrom.month, dateFrom.day, tzinfo=pytz.UTC)
+            eventMonthQ &= Q(effectiveEnd__gte=timeFrom)
+            threadMonthQ &= Q(validDate__gte=timeFrom)
+        if dateTo:
+            # through the end of that day
+            timeTo = datetime.datetime(dateTo.year, dateTo.month, dateTo.day, tzinfo=pytz.UTC) + datetime.timedelta(days=1)
+            eventMonthQ &= Q(effectiveStart__lt=timeTo)
+            threadMonthQ &= Q(validDate__lt=timeTo)
         # now, if tag was specified, get its event objects.
         # finally apply time constraint with monthQ after that
-        tagQ = Q()
+        visibleEvents = Event.objects.visible_to(request.user).select_related('owner').prefetch_related('tag_set', 'threads')
         try:
             if len(findForm.cleaned_data.get('tags')) < 1: raise KeyError # hack
-            for tagName in findForm.cleaned_data.get('tags'):
-                tagQ &= Q(name=tagName)
-            # this part is a C.F. to get a list of unique events having one of the defined tags
-            foundEventDict = {}
-            for tag in Tag.objects.filter(tagQ):
-                for event in tag.events.filter(eventMonthQ).iterator():
-                    if event.owner == request.user or event.isPublic:
-                        foundEventDict[event.pk] = event
-            foundEvents = foundEventDict.values()
+            # events having one of the defined tags
+            foundEvents = visibleEvents.filter(eventMonthQ).filter(tag__name__in=findForm.cleaned_data.get('tags')).distinct()
         except KeyError: # no tags, filter only by month
-            foundEvents = Event.objects.filter(eventMonthQ)
+            foundEvents = visibleEvents.filter(eventMonthQ)
         except:
             Http404('Error processing tag selection')
         # handle threads separately; this will allow content from threads in floating events to be viewed
         foundThreads = []
         try:
             textSearchStr = findForm.cleaned_data['textSearch']
-            for thread in Thread.objects.filter(threadMonthQ):
-                if textSearchStr.lower() in thread.title.lower() or len(thread.discussions.filter(text__icontains=textSearchStr)):
-                    foundThreads.append(thread)
+            if textSearchStr:
+                foundThreads = searchThreads(Thread.objects.visible_to(request.user).filter(threadMonthQ), textSearchStr)
         except KeyError:
             pass # no text specified, so no threads will be returned
         except:
@@ -203,8 +241,8 @@ def extendThread(request, _id):
             _text = newDiscussion.cleaned_data['_text']
             discoObj = Discussion(author=request.user, text=_text)
             discoObj.save()
+            # the receivers in signals.py update steward, activity and version for the new discussion
             parent.discussions.add(discoObj)
-            parent.save()
             return HttpResponseRedirect(reverse('singleThread', args=[parent.pk]))
     else:
         textBox = DiscussionFormTextOnly()
@@ -232,7 +270,7 @@ def allDiscussions(request):
 @login_required
 def newEvent(request):
     if request.method == 'POST':
-        newEvent = EventForm(request.POST)
+        newEvent = EventForm(request.POST, user=request.user)
         if newEvent.is_valid():
             _title = newEvent.cleaned_data['_title']
             _startDate = newEvent.cleaned_data['_startDate']
@@ -249,9 +287,8 @@ def newEvent(request):
                 obj = Event(owner=request.user, title=_title, isPublic=_isPublic, isPermanent=_isPermanent)
             obj.save()
             _threadIds = newEvent.cleaned_data['_threadChoices']
-            for t in _threadIds:
-                threadObj = Thread.objects.get(pk=t)
-                obj.threads.add(threadObj)
+            if _threadIds:
+                obj.threads.add(*Thread.objects.filter(pk__in=_threadIds))
             _isPinned = newEvent.cleaned_data['_isPinned']
             if _isPinned:
                 pin = Pin(owner=request.user, event=obj)
@@ -296,7 +333,7 @@ class ChangeThread(UpdateView):
                 return render(self.request, 'tracker/accessDenied.html', {
                     'reason': "This thread has been frozen, and must be unfrozen by its steward to allow changes."
                 })
-            elif self.request.user == getThreadSteward(self.object):
+            elif self.object.steward_id == self.request.user.pk:
                 self.object = form.save()
             	return HttpResponseRedirect(reverse('singleThread', args=[self.object.pk]))
             else:
@@ -312,29 +349,14 @@ class ChangeThread(UpdateView):
 
 @login_required
 def singleEvent(request, _id):
-    thisEvent = Event.objects.get(id=_id)
+    thisEvent = Event.objects.select_related('owner').get(id=_id)
     # if event is private, and user is not the owner, don't show
     if not thisEvent.isPublic and thisEvent.owner != request.user:
         return render(request, 'tracker/accessDenied.html', {
             'reason': 'The owner of this event has chosen to keep it private. Other users are not allowed to view it.'
         })
-    eventThreads = thisEvent.threads.all()
-    threadKeys = [x['id'] for x in eventThreads.values('id').order_by('validDate')]
-    discussions = {}
-    threadTitles = {}
-    validDates = {}
-    extensibility = {}
-    discos = {}
-    allowEdits = {}
-    for key in threadKeys:
-        thisThread = eventThreads.get(id=key)
-        discussions[key] = thisThread.discussions.all().order_by('-createdDate')
-        threadTitles[key] = thisThread.title
-        validDates[key] = thisThread.validDate
-        extensibility[key] = thisThread.isExtensible
-        allowEdits[key] = False
-        if getThreadSteward(thisThread) == request.user:
-            allowEdits[key] = True
+    # read before the threads, so a change made while they are read is still sent to the page
+    liveUpdatesAfter = live.latestUpdate()
     pinStatus = Pin.objects.filter(event=thisEvent.pk).exists()
     return render(request, 'tracker/singleEvent.html', { \
         'event': thisEvent, \
@@ -342,19 +364,15 @@ def singleEvent(request, _id):
 # TODO security to prevent malicious JS from being put into tagList
         'eventTagList': ','.join([str(x) for x in thisEvent.tag_set.all()]), \
         'fullTagList': ','.join([str(x) for x in Tag.objects.all()]), \
-        'threadKeys': threadKeys, \
-        'discussionSets': discussions, \
-        'threadTitles': threadTitles, \
-        'validDates': validDates, \
-        'extensibility': extensibility, \
-        'allowEdits': allowEdits, \
+        'threads': threadsForDisplay(thisEvent.threads.all(), request.user), \
+        'liveUpdatesAfter': liveUpdatesAfter, \
     })
 
 @login_required
 def singleTag(request, tagName):
     try:
         thisTag = Tag.objects.get(name=tagName)
-        relEvents = thisTag.events.filter(Q(owner=request.user) | Q(isPublic=True))
+        relEvents = thisTag.events.visible_to(request.user).select_related('owner').prefetch_related('tag_set', 'threads')
         someArePrivate = thisTag.events.exclude(owner=request.user).filter(isPublic=False).count() > 0
     except:
         relEvents = None
@@ -369,33 +387,13 @@ def singleTag(request, tagName):
 def singleThread(request, _id):
     thisThread = Thread.objects.get(pk=_id)
     relEvents = thisThread.event_set.all()
-    steward = getThreadSteward(thisThread)
     if not threadIsAccessible(thisThread, request.user):
         return render(request, 'tracker/accessDenied.html', {
             'reason': 'Another user is the steward of this thread, and that user has not made it part of any public event.'
         })
-    threadKeys = {}
-    discussions = {}
-    threadTitles = {}
-    validDates = {}
-    extensibility = {}
-    threadKeys[_id] = thisThread.pk
-    discussions[_id] = thisThread.discussions.all().order_by('-createdDate')
-    threadTitles[_id] = thisThread.title
-    validDates[_id] = thisThread.validDate
-    extensibility[_id] = thisThread.isExtensible
-    allowEdits = {}
-    allowEdits[_id] = False
-    if steward == request.user:
-        allowEdits[_id] = True
     return render(request, 'tracker/singleThread.html', { \
         'relEvents': relEvents, \
-        'threadKeys': threadKeys, \
-        'discussionSets': discussions, \
-        'threadTitles': threadTitles, \
-        'extensibility': extensibility, \
-        'validDates': validDates, \
-        'allowEdits': allowEdits, \
+        'threads': threadsForDisplay(Thread.objects.filter(pk=thisThread.pk), request.user), \
     })
 
 def asyncTogglePin(request):
@@ -448,7 +446,7 @@ def asyncToggleTag(request):
             newTag.save()
             newTag.events.add(eventObj)
         else:
-            if eventObj in tagObj.events.all():
+            if tagObj.events.filter(pk=eventObj.pk).exists():
                 # untag event (remove its id from tag object)
                 tagObj.events.remove(eventObj)
             else:
@@ -457,56 +455,289 @@ def asyncToggleTag(request):
         # return comma-delimited list of tags
         return HttpResponse(','.join([str(x) for x in eventObj.tag_set.all()]))
 
+def conditionalOnData(view):
+    '''
+    Decorator for GET views whose response depends only on threads, events and their associations,
+    the user and the query string: answers 304 when the client's copy is still current (see DataVersion),
+    without calling the view. Hits and misses are counted in viewstats.
+    '''
+    conditional = condition(etag_func=dataVersionEtag, last_modified_func=dataVersionModified)(view)
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        viewstats.count('{0:s}.{1:s}'.format(view.__name__, 'notModified' if response.status_code == 304 else 'computed'))
+        return response
+    return wrapped
+
+def requestDataVersion(request):
+    # read once per request, as both the ETag and Last-Modified need it
+    if not hasattr(request, '_dataVersion'):
+        request._dataVersion = currentDataVersion()
+    return request._dataVersion
+
+def dataVersionEtag(request, *args, **kwargs):
+    key = '{0}:{1}:{2}'.format(requestDataVersion(request)[0], request.user.pk, request.META.get('QUERY_STRING', ''))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def dataVersionModified(request, *args, **kwargs):
+    return requestDataVersion(request)[1]
+
+@conditionalOnData
 def asyncThreadsForPeriod(request):
     '''
     Get a JSON object representing threads that fall in the specified period (GET fields 'from' and 'to').
-    Returns status 400 and an empty string if user is not logged in.
+    Returns status 400 and an empty string if user is not logged in or a time is malformed.
     Otherwise returns JSON object mapping thread IDs to their names.
     '''
     if not request.user.is_authenticated():
         return HttpResponseBadRequest()
     if request.method == 'GET':
         timePattern = re.compile(r'(\d{4})-?(\d\d)-?(\d\d)_(\d\d):?(\d\d)')
-        tF = timePattern.match(request.GET['from'])
-        tT = timePattern.match(request.GET['to'])
-        if tF and tT:
+        tF = timePattern.match(request.GET.get('from', ''))
+        tT = timePattern.match(request.GET.get('to', ''))
+        if not (tF and tT):
+            return HttpResponseBadRequest()
+        try:
             timeFrom = datetime.datetime(int(tF.group(1), 10), int(tF.group(2), 10), int(tF.group(3), 10), int(tF.group(4), 10), int(tF.group(5), 10), second=0, tzinfo=pytz.UTC)
             timeTo = datetime.datetime(int(tT.group(1), 10), int(tT.group(2), 10), int(tT.group(3), 10), int(tT.group(4), 10), int(tT.group(5), 10), second=59, tzinfo=pytz.UTC)
-        else:
-            return
+        except ValueError: # no such date, e.g. February 30
+            return HttpResponseBadRequest()
         # return json obj of id's and names (so JS in template can make listbox)
         resp = {}
-        for t in Thread.objects.filter(validDate__gte=timeFrom,validDate__lte=timeTo).order_by('validDate'):
-            if threadIsAccessible(t,request.user): resp["{0:d}".format(t.id)] = str(t)
+        for t in Thread.objects.visible_to(request.user).filter(validDate__gte=timeFrom,validDate__lte=timeTo).order_by('validDate'):
+            resp["{0:d}".format(t.id)] = str(t)
         return JsonResponse(resp)
+    else:
+        return HttpResponseBadRequest()
 
+@conditionalOnData
 def asyncEventsAtTime(request):
     '''
     Get a JSON object representing events that span the specified point in time (GET field 'when').
     GET field 'threadId' can optionally be set to indicate which event(s) are already associated with that thread.
-    Returns status 400 and an empty string if user is not logged in.
+    Returns status 400 and an empty string if user is not logged in or the time is malformed.
     Otherwise returns JSON object mapping thread IDs to their names.
     '''
     if not request.user.is_authenticated():
         return HttpResponseBadRequest()
     if request.method == 'GET':
         timePattern = re.compile(r'(\d{4})-?(\d\d)-?(\d\d)_(\d\d):?(\d\d)')
-        when = timePattern.match(request.GET['when'])
-        if when:
+        when = timePattern.match(request.GET.get('when', ''))
+        if not when:
+            return HttpResponseBadRequest()
+        try:
             timePoint = datetime.datetime(int(when.group(1), 10), int(when.group(2), 10), int(when.group(3), 10), int(when.group(4), 10), int(when.group(5), 10), second=0, tzinfo=pytz.UTC)
-        else:
-            return
-        if request.GET['threadId'] is not None:
-            specThread = Thread.objects.get(id=request.GET['threadId'])
+        except ValueError: # no such date, e.g. February 30
+            return HttpResponseBadRequest()
+        # includes floating events, whose time range is that of their threads
+        matchingEvents = Event.objects.visible_to(request.user).spanning(timePoint)
+        # events already associated with the specified thread, found with one query on the through table
+        associated = set()
+        if request.GET.get('threadId'):
+            associated = set(Event.threads.through.objects.filter(thread=request.GET['threadId'], event__in=matchingEvents).values_list('event', flat=True))
         # return json obj mapping pk to identifying info
         resp = {}
-        for e in Event.objects.filter(startDate__lte=timePoint,endDate__gte=timePoint).order_by('startDate'):
-            threadStatus = False # initially assume not associated with event
-            if specThread in e.threads.all(): threadStatus = True
-            if e.owner == request.user or e.isPublic:
-                resp["{0:d}".format(e.pk)] = [e.title, str(e.owner), threadStatus]
+        for e in matchingEvents.select_related('owner').order_by('effectiveStart'):
+            resp["{0:d}".format(e.pk)] = [e.title, str(e.owner), e.pk in associated]
         return JsonResponse(resp)
+    else:
+        return HttpResponseBadRequest()
     
+def asyncTimelineEvents(request):
+    '''
+    Get a JSON object with the next page of the home timeline (GET field 'older' or 'newer',
+    set to a cursor given by the home page or a previous call).
+    Returns status 400 and an empty string if user is not logged in or the cursor is malformed.
+    Otherwise returns JSON object with 'events' (list of [id, title, time range], newest first)
+    and the 'older' and 'newer' cursors to continue from (null when there is nothing more).
+    '''
+    if not request.user.is_authenticated():
+        return HttpResponseBadRequest()
+    if request.method == 'GET':
+        try:
+            older = parseTimelineCursor(request.GET['older']) if 'older' in request.GET else None
+            newer = parseTimelineCursor(request.GET['newer']) if 'newer' in request.GET else None
+        except ValueError:
+            return HttpResponseBadRequest()
+        (events, olderCursor, newerCursor) = timelinePage(request.user, older=older, newer=newer)
+        return JsonResponse({
+            'events': [[e.pk, e.title, e.describeTimeRange()] for e in events],
+            'older': olderCursor,
+            'newer': newerCursor,
+        })
+
+def asyncTimeline(request):
+    '''
+    Get a JSON object describing activity in a period (GET fields 'from' and 'to'), split into
+    bins of size given by GET field 'bin' ('hour', '6h' or 'day'; bins are aligned to UTC midnight).
+    Returns status 400 and an empty string if user is not logged in or the fields are invalid.
+    Otherwise returns JSON object with
+      'bins': list of {'start', 'threads', 'discussions', 'events'}: number of threads valid in the bin,
+        discussions written in it, and events whose time range overlaps it
+      'events': list of [id, title, start, end] for events overlapping the period
+      'threads': list of [id, title, valid time] for threads valid in the period (at most activityMaxThreads)
+      'threadsTruncated': true if there were more threads than that
+    '''
+    if not request.user.is_authenticated():
+        return HttpResponseBadRequest()
+    if request.method == 'GET':
+        timePattern = re.compile(r'(\d{4})-?(\d\d)-?(\d\d)_(\d\d):?(\d\d)')
+        tF = timePattern.match(request.GET.get('from', ''))
+        tT = timePattern.match(request.GET.get('to', ''))
+        binSize = activityBinSizes.get(request.GET.get('bin', 'day'))
+        if not (tF and tT and binSize):
+            return HttpResponseBadRequest()
+        try:
+            timeFrom = datetime.datetime(*[int(x, 10) for x in tF.groups()], tzinfo=pytz.UTC)
+            timeTo = datetime.datetime(*[int(x, 10) for x in tT.groups()], tzinfo=pytz.UTC)
+        except ValueError: # no such date, e.g. February 30
+            return HttpResponseBadRequest()
+        firstBin = epochSeconds(timeFrom) // binSize
+        lastBin = (epochSeconds(timeTo) - 1) // binSize
+        if lastBin < firstBin or lastBin - firstBin >= activityMaxBins:
+            return HttpResponseBadRequest()
+        threads = Thread.objects.visible_to(request.user).filter(validDate__gte=timeFrom, validDate__lt=timeTo)
+        discussions = Discussion.objects.filter(thread__in=Thread.objects.visible_to(request.user), createdDate__gte=timeFrom, createdDate__lt=timeTo)
+        threadCounts = binnedCounts(threads, 'validDate', binSize)
+        discussionCounts = binnedCounts(discussions, 'createdDate', binSize)
+        # events are few compared to threads, so their (multi-bin) overlaps are counted here
+        events = list(Event.objects.visible_to(request.user).spanning(timeFrom, timeTo).order_by('effectiveStart'))
+        eventCounts = defaultdict(int)
+        for e in events:
+            for b in range(max(firstBin, epochSeconds(e.effectiveStart) // binSize), min(lastBin, epochSeconds(e.effectiveEnd) // binSize) + 1):
+                eventCounts[b] += 1
+        threadItems = list(threads.order_by('validDate').values_list('pk', 'title', 'validDate')[:activityMaxThreads + 1])
+        return JsonResponse({
+            'bins': [{
+                'start': datetime.datetime.fromtimestamp(b * binSize, pytz.UTC).isoformat(),
+                'threads': threadCounts.get(b, 0),
+                'discussions': discussionCounts.get(b, 0),
+                'events': eventCounts[b],
+            } for b in range(firstBin, lastBin + 1)],
+            'events': [[e.pk, e.title, e.effectiveStart.isoformat(), e.effectiveEnd.isoformat()] for e in events],
+            'threads': [[pk, title, validDate.isoformat()] for (pk, title, validDate) in threadItems[:activityMaxThreads]],
+            'threadsTruncated': len(threadItems) > activityMaxThreads,
+        })
+
+@login_required
+def review(request):
+    "Numbers of events and threads by year, month and season; with GET field 'year', 'month' or 'season', also those in that bucket."
+    try:
+        kind, value = parseBucket(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest()
+    counts = rollup(request.user)
+    events = threads = None
+    if kind:
+        events = list(bucketEvents(request.user, kind, value).select_related('owner')[:reviewMaxItems])
+        threads = list(bucketThreads(request.user, kind, value)[:reviewMaxItems])
+    return render(request, 'tracker/review.html', { \
+        'rollupTables': [('Years', 'year', counts['years']), ('Months', 'month', counts['months']), ('Seasons', 'season', counts['seasons'])], \
+        'bucketKind': kind, \
+        'bucketName': bucketName(kind, value) if kind else None, \
+        'bucketEvents': events, \
+        'bucketThreads': threads, \
+        'maxItems': reviewMaxItems, \
+    })
+
+@conditionalOnData
+def asyncReview(request):
+    '''
+    Get a JSON object counting events and threads by calendar year, month and meteorological season,
+    across all years. Returns status 400 and an empty string if user is not logged in or the bucket is invalid.
+    Otherwise returns JSON object with
+      'years', 'months', 'seasons': lists of {'value', 'name', 'events', 'threads'}
+    and, if one of the GET fields 'year', 'month' (1-12) or 'season' (winter, spring, summer, autumn) is given,
+      'events': list of [id, title, start, end] for events touching that bucket (at most reviewMaxItems)
+      'threads': list of [id, title, valid time] for threads valid in it (at most reviewMaxItems)
+      'eventsTruncated', 'threadsTruncated': true if there were more than that
+    '''
+    if not request.user.is_authenticated():
+        return HttpResponseBadRequest()
+    try:
+        kind, value = parseBucket(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest()
+    result = rollup(request.user)
+    if kind:
+        events = list(bucketEvents(request.user, kind, value).values_list('pk', 'title', 'effectiveStart', 'effectiveEnd')[:reviewMaxItems + 1])
+        threads = list(bucketThreads(request.user, kind, value).values_list('pk', 'title', 'validDate')[:reviewMaxItems + 1])
+        result.update({
+            'events': [[pk, title, start.isoformat(), end.isoformat()] for (pk, title, start, end) in events[:reviewMaxItems]],
+            'eventsTruncated': len(events) > reviewMaxItems,
+            'threads': [[pk, title, validDate.isoformat()] for (pk, title, validDate) in threads[:reviewMaxItems]],
+            'threadsTruncated': len(threads) > reviewMaxItems,
+        })
+    return JsonResponse(result)
+
+@login_required
+def export(request):
+    '''
+    Stream events with their threads, discussions, tags and authors as NDJSON (one event per line).
+    Staff only. Optional GET fields: 'from' and 'to' (both, to select events overlapping the period),
+    'tag' (repeatable; events carrying any of them), 'gzip' (nonempty to compress the stream).
+    '''
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    timeFrom = timeTo = None
+    if request.GET.get('from') or request.GET.get('to'):
+        timePattern = re.compile(r'(\d{4})-?(\d\d)-?(\d\d)_(\d\d):?(\d\d)')
+        tF = timePattern.match(request.GET.get('from', ''))
+        tT = timePattern.match(request.GET.get('to', ''))
+        if not (tF and tT):
+            return HttpResponseBadRequest()
+        timeFrom = datetime.datetime(*[int(x, 10) for x in tF.groups()], tzinfo=pytz.UTC)
+        timeTo = datetime.datetime(*[int(x, 10) for x in tT.groups()], tzinfo=pytz.UTC)
+    lines = ndjsonLines(exportRecords(exportEvents(timeFrom, timeTo, request.GET.getlist('tag'))))
+    fileName = 'weathredds-export.ndjson'
+    if request.GET.get('gzip'):
+        response = StreamingHttpResponse(gzipChunks(lines), content_type='application/gzip')
+        fileName += '.gz'
+    else:
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="{0:s}"'.format(fileName)
+    return response
+
+@login_required
+def viewStats(request):
+    '''
+    Get a JSON object with the latency and SQL statistics ViewStatsMiddleware has collected in this
+    server process, keyed by URL name, and the counters kept through viewstats.count(). Staff only.
+    '''
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    return JsonResponse({
+        'pid': os.getpid(),
+        'explainThresholdMs': viewstats.explainThreshold,
+        'views': viewstats.snapshot(),
+        'counters': viewstats.counters(),
+    })
+
+def asyncEventUpdates(request):
+    '''
+    Long-poll for changes to the threads of an event (GET field 'event') made after update 'after'
+    (from the singleEvent page, or a previous call). Waits up to liveUpdateTimeout seconds for one to happen.
+    Returns status 400 and an empty string if user is not logged in or a field is invalid.
+    Returns status 403 if the event is private and not the user's.
+    Otherwise returns JSON object with 'updates' (list of [update id, kind, data], oldest first;
+    kinds are 'discussion', 'thread' and 'association', see live.py) and 'after' to continue from.
+    '''
+    if not request.user.is_authenticated():
+        return HttpResponseBadRequest()
+    if request.method == 'GET':
+        try:
+            eventId = int(request.GET['event'])
+            after = int(request.GET['after'])
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest()
+        if not Event.objects.visible_to(request.user).filter(pk=eventId).exists():
+            return HttpResponseForbidden()
+        updates = live.waitForUpdates(eventId, after, liveUpdateTimeout)
+        return JsonResponse({
+            'updates': [[pk, kind, json.loads(data)] for (pk, kind, data) in updates],
+            'after': updates[-1][0] if updates else after,
+        })
+
 def asyncToggleFrozen(request):
     '''
     Toggle isExtensible on the thread with its ID specified in GET field 'thread'.
@@ -539,54 +770,197 @@ def asyncAssociateEventsWithThread(request):
     if not request.user.is_authenticated():
         return HttpResponseBadRequest()
     if request.method == 'GET':
-        threadId = request.GET['threadId']
-        selectedEventArray = request.GET.getlist('newRelations')
-        allEventArray = request.GET['allMatchingEvents'].split(',')
         try:
-            threadObj = Thread.objects.get(pk=threadId)
-        except Thread.DoesNotExist: # 404
-            return HttpResponseNotFound()
-        if request.user != getThreadSteward(threadObj): # 403
-            # NOTE: if http response is not 2xx, OR there is a response string, Firefox redirects to the URL given in $.get()
-            errmsg = 'Access denied. Steward of thread is ' + getThreadSteward(threadObj) + '.'
-            return HttpResponseForbidden(reason=errmsg)
-        eventObjList = {}
-        # check that all the events exist -- if not don't make any changes
-        for eId in allEventArray:
-            try:
-                eventObjList[eId] = Event.objects.get(pk=eId)
-                if request.user != eventObjList[eId].owner: # 403
-                    errmsg = 'Access denied. Owner of event is ' + str(eventObjList[eId].owner) + '.'
-                    return HttpResponseForbidden(reason=errmsg)
-            except Event.DoesNotExist:
-                return HttpResponseNotFound()
-        # Must first remove the thread from all events that were in the form,
-        # then add it back to the ones that were checked
-        for eId in allEventArray:
-            eventObj = eventObjList[eId]
-            if threadObj in eventObj.threads.all():
-                eventObj.threads.remove(threadObj)
-        for eId in selectedEventArray:
-            eventObj = eventObjList[eId]
-            eventObj.threads.add(threadObj)
+            threadId = int(request.GET['threadId'])
+            selectedEvents = set(int(e) for e in request.GET.getlist('newRelations'))
+            allEvents = set(int(e) for e in request.GET['allMatchingEvents'].split(',') if e)
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest()
+        # the thread ends up in the checked events, and in none of the others that were in the form
+        error = associationError(request.user, [(threadId, e) for e in allEvents | selectedEvents])
+        if error:
+            return error
+        applyAssociations([(threadId, e) for e in selectedEvents], [(threadId, e) for e in allEvents - selectedEvents])
         return HttpResponse(status=204)
     else:
         return HttpResponseBadRequest()
 
+def asyncAssociate(request):
+    '''
+    Add and remove many thread-event associations at once. POST body is a JSON object with
+    'add' and 'remove', each a list of [thread ID, event ID] pairs.
+    Returns status 400 if the body is malformed, 404 if a thread or event does not exist, and
+    403 if user is not the steward of every thread and the owner of every event (no changes are made then).
+    Returns status 400 and an empty string if user is not logged in.
+    Otherwise returns JSON object with the number of associations 'added' and 'removed'.
+    '''
+    if not request.user.is_authenticated() or request.method != 'POST':
+        return HttpResponseBadRequest()
+    try:
+        body = json.loads(request.body.decode('utf-8'))
+        add = set((int(t), int(e)) for (t, e) in body.get('add', []))
+        remove = set((int(t), int(e)) for (t, e) in body.get('remove', [])) - add
+    except (ValueError, TypeError, AttributeError):
+        return HttpResponseBadRequest()
+    error = associationError(request.user, add | remove)
+    if error:
+        return error
+    (added, removed) = applyAssociations(add, remove)
+    return JsonResponse({'added': added, 'removed': removed})
+
+def associationError(user, pairs):
+    "Response to send if user may not change the given (thread ID, event ID) associations, otherwise None."
+    threads = Thread.objects.in_bulk(set(t for (t, e) in pairs))
+    events = Event.objects.select_related('owner').in_bulk(set(e for (t, e) in pairs))
+    if len(threads) < len(set(t for (t, e) in pairs)) or len(events) < len(set(e for (t, e) in pairs)): # 404
+        return HttpResponseNotFound()
+    for thread in threads.values():
+        if thread.steward_id != user.pk: # 403
+            # NOTE: if http response is not 2xx, OR there is a response string, Firefox redirects to the URL given in $.get()
+            return HttpResponseForbidden(reason='Access denied. Steward of thread is ' + str(getThreadSteward(thread)) + '.')
+    for event in events.values():
+        if event.owner_id != user.pk: # 403
+            return HttpResponseForbidden(reason='Access denied. Owner of event is ' + str(event.owner) + '.')
+    return None
+
+def applyAssociations(add, remove):
+    '''
+    Make the threads and events in the (thread ID, event ID) pairs of add associated, and those of remove not.
+    Returns the number of associations actually added and removed.
+    '''
+    Through = Event.threads.through
+    pairs = set(add) | set(remove)
+    if not pairs:
+        return (0, 0)
+    with transaction.atomic():
+        # current rows for every pair, in one query (the thread/event cross product is a superset)
+        existing = dict(((t, e), pk) for (pk, t, e) in Through.objects.filter(
+            thread__in=set(t for (t, e) in pairs), event__in=set(e for (t, e) in pairs)).values_list('pk', 'thread', 'event'))
+        toAdd = [pair for pair in add if pair not in existing]
+        toRemove = [pair for pair in remove if pair in existing]
+        # the rows are written in bulk, which sends no m2m_changed; it is sent here for each event as
+        # event.threads.add() and remove() would, so the receivers in signals.py do the bookkeeping
+        events = Event.objects.in_bulk(set(e for (t, e) in toAdd + toRemove))
+        sendThreadsChanged('pre_add', toAdd, events)
+        Through.objects.bulk_create([Through(thread_id=t, event_id=e) for (t, e) in toAdd])
+        sendThreadsChanged('post_add', toAdd, events)
+        sendThreadsChanged('pre_remove', toRemove, events)
+        if toRemove:
+            Through.objects.filter(pk__in=[existing[pair] for pair in toRemove]).delete()
+        sendThreadsChanged('post_remove', toRemove, events)
+    return (len(toAdd), len(toRemove))
+
+def sendThreadsChanged(action, pairs, events):
+    "Send m2m_changed for Event.threads once per event in the (thread ID, event ID) pairs."
+    threadPks = defaultdict(set)
+    for (t, e) in pairs:
+        threadPks[e].add(t)
+    for (e, pkSet) in sorted(threadPks.items()):
+        m2m_changed.send(sender=Event.threads.through, instance=events[e], action=action, reverse=False,
+            model=Thread, pk_set=pkSet, using=events[e]._state.db)
+
+def epochSeconds(dt):
+    return int((dt - datetime.datetime(1970, 1, 1, tzinfo=pytz.UTC)).total_seconds())
+
+def binnedCounts(queryset, dateField, binSize):
+    '''
+    Count the rows of queryset in each time bin of binSize seconds (numbered from the Unix epoch)
+    by the date in dateField, with one GROUP BY on SQLite. Returns a dict mapping bin number to count.
+    '''
+    if connection.vendor != 'sqlite':
+        # strftime('%s') is SQLite's; elsewhere the dates are binned here
+        counts = defaultdict(int)
+        for (pk, date) in queryset.values_list('pk', dateField).distinct().order_by():
+            counts[epochSeconds(date) // binSize] += 1
+        return dict(counts)
+    column = '{0:s}."{1:s}"'.format(queryset.model._meta.db_table, queryset.model._meta.get_field(dateField).column)
+    binSql = "CAST(strftime('%%s', {0:s}) AS INTEGER) / %s".format(column)
+    rows = queryset.extra(select={'bin': binSql}, select_params=[binSize]).values('bin').annotate(n=Count('pk', distinct=True)).order_by()
+    return dict((row['bin'], row['n']) for row in rows)
+
+def timelinePage(user, older=None, newer=None):
+    '''
+    One page of the events visible to user, newest first, using keyset paging on (effectiveStart, pk).
+    older/newer are (datetime, pk) keys to page away from; with neither, the page starts just after now.
+    Returns (events, olderCursor, newerCursor), where a cursor is None if there is nothing more that way.
+    Events with no time range at all (floating, with no threads) are not on the timeline.
+    '''
+    events = Event.objects.visible_to(user).filter(effectiveStart__isnull=False)
+    if newer is not None:
+        (start, pk) = newer
+        page = list(events.filter(Q(effectiveStart__gt=start) | Q(effectiveStart=start, pk__gt=pk)).order_by('effectiveStart', 'pk')[:timelinePageSize + 1])
+        moreNewer = len(page) > timelinePageSize
+        page = page[:timelinePageSize]
+        page.reverse()
+        moreOlder = True
+    else:
+        if older is not None:
+            (start, pk) = older
+            olderQ = Q(effectiveStart__lt=start) | Q(effectiveStart=start, pk__lt=pk)
+            moreNewer = True
+        else:
+            start = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC) + timelineLookahead
+            olderQ = Q(effectiveStart__lte=start)
+            moreNewer = events.filter(effectiveStart__gt=start).exists()
+        page = list(events.filter(olderQ).order_by('-effectiveStart', '-pk')[:timelinePageSize + 1])
+        moreOlder = len(page) > timelinePageSize
+        page = page[:timelinePageSize]
+    if not page:
+        return (page, None, None)
+    olderCursor = timelineCursor(page[-1]) if moreOlder else None
+    newerCursor = timelineCursor(page[0]) if moreNewer else None
+    return (page, olderCursor, newerCursor)
+
+def timelineCursor(event):
+    return '{0:s}_{1:d}'.format(event.effectiveStart.strftime('%Y%m%d%H%M%S%f'), event.pk)
+
+def parseTimelineCursor(cursor):
+    c = timelineCursorPattern.match(cursor)
+    if not c:
+        raise ValueError('bad timeline cursor')
+    when = datetime.datetime(*[int(x, 10) for x in c.groups()[:7]], tzinfo=pytz.UTC)
+    return (when, int(c.group(8), 10))
+
+def threadsForDisplay(threads, user):
+    '''
+    Evaluate a Thread queryset for tracker/thread.html, ordered by valid date.
+    Each thread gets body (its rendered discussions, from the cache when the thread's version
+    hasn't changed) and allowEdits, which is per user and so is never cached.
+    The number of queries is the same no matter how many threads or discussions there are.
+    '''
+    threads = list(threads.order_by('validDate'))
+    keyed = dict((threadBodyCacheKey(t), t) for t in threads)
+    bodies = cache.get_many(keyed.keys())
+    missing = [t for key, t in keyed.items() if key not in bodies]
+    discussions = defaultdict(list)
+    if missing:
+        # one query for the discussions of all uncached threads, newest first
+        links = Thread.discussions.through.objects.filter(thread__in=missing).select_related('discussion__author').order_by('-discussion__createdDate')
+        for link in links:
+            discussions[link.thread_id].append(link.discussion)
+    newBodies = {}
+    for key, thread in keyed.items():
+        if key in bodies:
+            thread.body = bodies[key]
+        else:
+            thread.body = newBodies[key] = render_to_string('tracker/threadBody.html', {'discussions': discussions[thread.pk]})
+        thread.allowEdits = thread.steward_id == user.pk
+    cache.set_many(newBodies, threadBodyTimeout)
+    return threads
+
+def threadBodyCacheKey(thread):
+    # version is bumped whenever the thread changes, so stale bodies are simply never asked for again
+    return 'threadBody:{0:d}:{1:d}'.format(thread.pk, thread.version)
+
 def getThreadSteward(thread):
     # the author of the first discussion is considered the "owner" or "steward" of the thread
-    minPk = thread.discussions.all().aggregate(Min("pk"))
-    return thread.discussions.get(pk=minPk['pk__min']).author
+    # (kept up to date in Thread.steward; compare steward_id where the User object isn't needed)
+    return thread.steward
 
 def threadIsAccessible(thread, user):
-    # if user is not steward of thread, check events to see if thread is part of a public event
+    # user must be steward of thread, or thread must be part of a public event
     # if not, return false to indicate access should be denied
-    if getThreadSteward(thread) == user:
-        return True
-    else:
-        for event in thread.event_set.all():
-            if event.isPublic: return True
-    return False
+    return Thread.objects.visible_to(user).filter(pk=thread.pk).exists()
 
 def getDatetimePresets():
     now = datetime.datetime.utcnow()
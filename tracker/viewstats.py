@@ -0,0 +1,200 @@
+"""
+    Copyright 2016 Jacob C. Wimberley.
+
+    This file is part of Weathredds.
+
+    Weathredds is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Weathredds is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Weathredds.  If not, see <http://www.gnu.org/licenses/>.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from bisect import bisect_left
+import threading
+import time
+
+# Per-view latency and SQL statistics, collected by ViewStatsMiddleware and reported by the viewStats view.
+# Everything is kept in fixed-size histograms per URL name, in memory, so each server process has its own
+# figures. Queries are timed by a thin cursor wrapper (no SQL formatting, unlike the DEBUG cursor);
+# only queries slower than VIEW_STATS_EXPLAIN_MS are looked at more closely, with EXPLAIN.
+
+latencyBounds = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000) # ms; last bucket is everything above
+queryCountBounds = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+slowQueriesKept = 5 # per URL name
+explainThreshold = getattr(settings, 'VIEW_STATS_EXPLAIN_MS', 100) # ms
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+_counters = {}
+
+class Histogram(object):
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        "Upper bound of the bucket holding the given fraction of values (None if it is the open-ended one)."
+        wanted = fraction * sum(self.counts)
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= wanted:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return 0
+
+    def asDict(self):
+        n = sum(self.counts)
+        return {
+            'buckets': [[bound, count] for bound, count in zip(list(self.bounds) + [None], self.counts)],
+            'mean': float(self.total) / n if n else 0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+class ViewStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.latency = Histogram(latencyBounds)
+        self.sqlTime = Histogram(latencyBounds)
+        self.queryCount = Histogram(queryCountBounds)
+        self.slowQueries = [] # [ms, sql, explain] sorted slowest first, one per distinct SQL
+
+    def addSlowQuery(self, ms, sql, explain):
+        for entry in self.slowQueries:
+            if entry[1] == sql:
+                if ms > entry[0]:
+                    entry[0], entry[2] = ms, explain or entry[2]
+                break
+        else:
+            self.slowQueries.append([ms, sql, explain])
+        self.slowQueries.sort(reverse=True)
+        del self.slowQueries[slowQueriesKept:]
+
+    def isSlowEnough(self, ms, sql):
+        "Whether a query taking ms would make it into slowQueries."
+        if len(self.slowQueries) < slowQueriesKept or ms > self.slowQueries[-1][0]:
+            return True
+        return any(entry[1] == sql and ms > entry[0] for entry in self.slowQueries)
+
+    def asDict(self):
+        return {
+            'requests': self.requests,
+            'latencyMs': self.latency.asDict(),
+            'sqlTimeMs': self.sqlTime.asDict(),
+            'queries': self.queryCount.asDict(),
+            'slowestQueries': [{'ms': ms, 'sql': sql, 'explain': explain} for (ms, sql, explain) in self.slowQueries],
+        }
+
+class TimingCursorWrapper(CursorWrapper):
+    def execute(self, sql, params=None):
+        started = time.time()
+        try:
+            return super(TimingCursorWrapper, self).execute(sql, params)
+        finally:
+            recordQuery(self.db, sql, params, time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return super(TimingCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            recordQuery(self.db, sql, None, time.time() - started)
+
+def recordQuery(db, sql, params, seconds):
+    queries = getattr(_local, 'queries', None)
+    if queries is not None:
+        queries.append((db.alias, sql, params, seconds))
+
+def explain(alias, sql, params):
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    conn = connections[alias]
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.vendor == 'sqlite' else 'EXPLAIN '
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(unicode(col) for col in row) for row in cursor.fetchall()]
+    except Exception as e:
+        return ['EXPLAIN failed: {0}'.format(e)]
+
+def snapshot():
+    "Current statistics as a JSON-serializable dict keyed by URL name."
+    with _lock:
+        return dict((name, stats.asDict()) for (name, stats) in _stats.items())
+
+def count(name, n=1):
+    "Add n to a named counter (e.g. cache hits), reported by the viewStats view."
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _counters.clear()
+
+class ViewStatsMiddleware(object):
+    '''
+    Record latency, number and total time of SQL queries, and the slowest queries of every request,
+    grouped by URL name. List it first in MIDDLEWARE_CLASSES so the time spent in other middleware counts.
+    '''
+    def process_request(self, request):
+        for conn in connections.all():
+            if not getattr(conn, '_viewStatsTiming', False):
+                timeCursors(conn)
+        _local.queries = []
+        _local.started = time.time()
+
+    def process_response(self, request, response):
+        queries = getattr(_local, 'queries', None)
+        if queries is None:
+            return response
+        latency = (time.time() - _local.started) * 1000
+        _local.queries = None # stop recording, also for the EXPLAINs below
+        match = getattr(request, 'resolver_match', None)
+        name = (match.url_name if match else None) or '<unresolved>'
+        sqlTime = sum(q[3] for q in queries) * 1000
+        slow = [(seconds * 1000, alias, sql, params) for (alias, sql, params, seconds) in queries if seconds * 1000 >= explainThreshold]
+        with _lock:
+            stats = _stats.setdefault(name, ViewStats())
+            stats.requests += 1
+            stats.latency.add(latency)
+            stats.sqlTime.add(sqlTime)
+            stats.queryCount.add(len(queries))
+            slow = [q for q in slow if stats.isSlowEnough(q[0], q[2])]
+        # EXPLAIN outside the lock, and only for queries that will be kept
+        explained = [(ms, sql, explain(alias, sql, params)) for (ms, alias, sql, params) in slow]
+        with _lock:
+            for ms, sql, plan in explained:
+                stats.addSlowQuery(ms, sql, plan)
+        return response
+
+def timeCursors(conn):
+    # wrap the cursors this connection hands out, with or without DEBUG
+    makeCursor, makeDebugCursor = conn.make_cursor, conn.make_debug_cursor
+    conn.make_cursor = lambda cursor: TimingCursorWrapper(makeCursor(cursor), conn)
+    conn.make_debug_cursor = lambda cursor: TimingCursorWrapper(makeDebugCursor(cursor), conn)
+    conn._viewStatsTiming = True